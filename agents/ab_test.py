@@ -0,0 +1,439 @@
+# agents/ab_test.py
+"""
+A/B traffic split for the /generate and /generate/stream pipelines.
+
+The tier thresholds and model choices in router.py are static guesses. An
+A/B test sends a weighted share of conversations to an alternative tier or
+model and records per-variant latency, so a route (e.g. pushing more turns
+to T1 as fine-tuning improves it) can be promoted on evidence.
+
+Assignment is sticky: the variant is derived from sha256(test_id:conv_id),
+so every turn of a call hits the same variant in every worker process.
+
+Per-variant count, latency sum, latency sum-of-squares and errors are
+Prometheus metrics. Under gunicorn (PROMETHEUS_MULTIPROC_DIR set, see
+gunicorn.conf.py) GET /ab-results aggregates them across all workers before
+running Welch's t-test; a single process uses its own in-memory totals.
+p50/p95 are interpolated from the ab_variant_latency_ms histogram buckets.
+
+Environment variables:
+  AB_CONFIG - JSON test definition (default: no test), e.g.
+              {"test_id": "t1-vs-t2",
+               "agent_ids": ["agent-1"],              # optional tenant filter
+               "variants": [
+                 {"name": "control", "weight": 50},
+                 {"name": "t2", "weight": 50, "tier": "t2_medium"},
+                 {"name": "mini", "weight": 0,
+                  "provider": "openai", "model": "gpt-4o-mini"}]}
+              The first variant is the control. "tier" overrides the routed
+              tier; "provider" (sglang | kimi | openai) sends the variant to
+              that provider's endpoint for the tier; "model" pins an exact
+              model and requires "provider".
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from router import ModelTier
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("sglang", "kimi", "openai")
+
+
+@dataclass
+class ABVariant:
+    name: str
+    weight: int
+    tier: Optional[ModelTier] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+
+
+@dataclass
+class ABTest:
+    test_id: str
+    variants: list[ABVariant]
+    agent_ids: frozenset[str] = field(default_factory=frozenset)
+
+    def applies_to(self, agent_id: str) -> bool:
+        return not self.agent_ids or agent_id in self.agent_ids
+
+
+# ─── Configuration ────────────────────────────────────────────────────────────
+
+
+def load_ab_config(raw: str) -> Optional[ABTest]:
+    """Parse an AB_CONFIG JSON string; returns None when empty or invalid."""
+    if not raw.strip():
+        return None
+
+    try:
+        cfg = json.loads(raw)
+        variants = [
+            ABVariant(
+                name=str(v["name"]),
+                weight=int(v.get("weight", 0)),
+                tier=ModelTier(v["tier"]) if v.get("tier") else None,
+                provider=v.get("provider") or None,
+                model=v.get("model") or None,
+            )
+            for v in cfg["variants"]
+        ]
+        if any(v.weight < 0 for v in variants):
+            raise ValueError("variant weights must be >= 0")
+        if not variants or sum(v.weight for v in variants) <= 0:
+            raise ValueError("variant weights must sum to > 0")
+        for v in variants:
+            if v.provider is not None and v.provider not in PROVIDERS:
+                raise ValueError(f"variant {v.name!r}: unknown provider {v.provider!r}")
+            if v.model and v.provider is None:
+                # Without a provider the model would go to whichever endpoint
+                # the routed tier resolves to (e.g. gpt-4o-mini sent to Moonshot)
+                raise ValueError(f"variant {v.name!r}: 'model' requires 'provider'")
+        return ABTest(
+            test_id=str(cfg["test_id"]),
+            variants=variants,
+            agent_ids=frozenset(cfg.get("agent_ids") or ()),
+        )
+    except (ValueError, KeyError, TypeError) as exc:
+        logger.warning("Invalid AB_CONFIG — A/B testing disabled: %s", exc)
+        return None
+
+
+AB_TEST = load_ab_config(os.getenv("AB_CONFIG", ""))
+
+
+# ─── Assignment ───────────────────────────────────────────────────────────────
+
+
+def choose_variant(conv_id: str, test: ABTest) -> ABVariant:
+    """
+    Sticky weighted assignment of a conversation to a variant.
+
+    Uses sha256 rather than hash(), which is salted per process and would
+    reshuffle conversations between gunicorn workers.
+    """
+    digest = hashlib.sha256(f"{test.test_id}:{conv_id}".encode("utf-8")).digest()
+    total = sum(v.weight for v in test.variants)
+    bucket = int.from_bytes(digest[:8], "big") % total
+
+    for variant in test.variants:
+        if bucket < variant.weight:
+            return variant
+        bucket -= variant.weight
+
+    return test.variants[-1]  # unreachable with positive weights
+
+
+@dataclass
+class ABAssignment:
+    """A conversation's variant in the active test."""
+
+    test_id: str
+    variant: ABVariant
+
+    def record(self, latency_ms: float, ok: bool = True) -> None:
+        ab_stats.record(self.test_id, self.variant.name, latency_ms, ok)
+
+
+def assign(conv_id: str, agent_id: str = "") -> Optional[ABAssignment]:
+    """Variant for this conversation, or None when it is not enrolled."""
+    test = AB_TEST
+    if test is None or not conv_id or not test.applies_to(agent_id):
+        return None
+    return ABAssignment(test_id=test.test_id, variant=choose_variant(conv_id, test))
+
+
+# ─── Prometheus Metrics ───────────────────────────────────────────────────────
+
+# Latency histogram upper bounds (ms); also used to interpolate p50/p95
+LATENCY_BUCKETS_MS = (50, 100, 200, 300, 500, 800, 1200, 2000, 5000)
+
+_metrics_initialized = False
+_latency_histogram = None
+_latency_sq_counter = None
+_request_counter = None
+
+
+def _init_metrics():
+    """Initialize Prometheus metrics (lazy)."""
+    global _metrics_initialized, _latency_histogram, _latency_sq_counter, _request_counter
+
+    if _metrics_initialized:
+        return
+
+    try:
+        from prometheus_client import Counter, Histogram
+
+        _latency_histogram = Histogram(
+            "ab_variant_latency_ms",
+            "End-to-end /generate latency per A/B variant in milliseconds",
+            ["test_id", "variant"],
+            buckets=LATENCY_BUCKETS_MS,
+        )
+
+        # Histogram exports count and sum; the sum of squares completes the
+        # variance needed for Welch's t-test
+        _latency_sq_counter = Counter(
+            "ab_variant_latency_ms_squared",
+            "Sum of squared /generate latencies per A/B variant",
+            ["test_id", "variant"],
+        )
+
+        _request_counter = Counter(
+            "ab_variant_requests_total",
+            "Requests served per A/B variant",
+            ["test_id", "variant", "status"],
+        )
+
+    except ImportError:
+        logger.debug("prometheus_client not available, A/B metrics disabled")
+
+    _metrics_initialized = True
+
+
+# ─── Stats ────────────────────────────────────────────────────────────────────
+
+
+@dataclass
+class _VariantTotals:
+    """Sufficient statistics for one variant (sums merge across workers)."""
+
+    count: int = 0
+    errors: int = 0
+    total: float = 0.0
+    total_sq: float = 0.0
+    # Cumulative count per LATENCY_BUCKETS_MS bound (Prometheus "le" semantics)
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS_MS))
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a latency quantile by linear interpolation inside the
+        histogram bucket that contains it (as PromQL histogram_quantile does).
+        Observations above the last bound report that bound.
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        lower, below = 0.0, 0
+        for bound, cumulative in zip(LATENCY_BUCKETS_MS, self.buckets):
+            if cumulative >= rank:
+                in_bucket = cumulative - below
+                if in_bucket == 0:
+                    return float(bound)
+                return lower + (bound - lower) * (rank - below) / in_bucket
+            lower, below = float(bound), cumulative
+
+        return float(LATENCY_BUCKETS_MS[-1])
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def variance(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return max(0.0, (self.total_sq - self.count * self.mean ** 2) / (self.count - 1))
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Continued fraction for the incomplete beta function (modified Lentz)."""
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+
+    for m in range(1, 301):
+        m2 = 2 * m
+        for num in (
+            m * (b - m) * x / ((a + m2 - 1.0) * (a + m2)),
+            -(a + m) * (a + b + m) * x / ((a + m2) * (a + m2 + 1.0)),
+        ):
+            d = 1.0 + num * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + num / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+
+    return h
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+
+    log_front = (
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+        + a * math.log(x) + b * math.log1p(-x)
+    )
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(log_front) * _betacf(a, b, x) / a
+    return 1.0 - math.exp(log_front) * _betacf(b, a, 1.0 - x) / b
+
+
+def student_t_two_sided_p(t: float, df: float) -> float:
+    """Two-sided p-value of Student's t distribution (no scipy needed)."""
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def welch_t_test(a: _VariantTotals, b: _VariantTotals) -> Optional[dict]:
+    """
+    Welch's t-test on the difference in means (b - a).
+
+    The two-sided p-value comes from Student's t distribution with the
+    Welch–Satterthwaite degrees of freedom, so small samples are not
+    overstated. Returns None with fewer than 2 samples per variant.
+    """
+    if a.count < 2 or b.count < 2:
+        return None
+
+    se_a = a.variance / a.count
+    se_b = b.variance / b.count
+    se = math.sqrt(se_a + se_b)
+    if se == 0:
+        return None
+
+    t = (b.mean - a.mean) / se
+    # Welch–Satterthwaite degrees of freedom
+    df = (se_a + se_b) ** 2 / (se_a ** 2 / (a.count - 1) + se_b ** 2 / (b.count - 1))
+
+    return {
+        "delta_ms": round(b.mean - a.mean, 2),
+        "t": round(t, 4),
+        "df": round(df, 1),
+        "p_value": student_t_two_sided_p(t, df),
+    }
+
+
+def _totals_from_registry(registry, test_id: str) -> dict[str, _VariantTotals]:
+    """Rebuild per-variant totals for one test from collected Prometheus samples."""
+    totals: dict[str, _VariantTotals] = {}
+
+    for family in registry.collect():
+        for sample in family.samples:
+            if sample.labels.get("test_id") != test_id:
+                continue
+            t = totals.setdefault(sample.labels["variant"], _VariantTotals())
+
+            if sample.name == "ab_variant_latency_ms_count":
+                t.count = int(sample.value)
+            elif sample.name == "ab_variant_latency_ms_sum":
+                t.total = sample.value
+            elif sample.name == "ab_variant_latency_ms_bucket":
+                le = float(sample.labels["le"])
+                if le in LATENCY_BUCKETS_MS:
+                    t.buckets[LATENCY_BUCKETS_MS.index(le)] = int(sample.value)
+            elif sample.name == "ab_variant_latency_ms_squared_total":
+                t.total_sq = sample.value
+            elif sample.name == "ab_variant_requests_total" and sample.labels.get("status") == "error":
+                t.errors = int(sample.value)
+
+    return totals
+
+
+def _multiprocess_registry():
+    """Registry merging every gunicorn worker's metrics, or None outside gunicorn."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return None
+
+    try:
+        from prometheus_client import CollectorRegistry, multiprocess
+    except ImportError:
+        return None
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+class ABStats:
+    """Per-variant latency stats for the active test."""
+
+    def __init__(self):
+        self._totals: dict[tuple[str, str], _VariantTotals] = {}
+
+    def record(self, test_id: str, variant: str, latency_ms: float, ok: bool = True) -> None:
+        _init_metrics()
+        totals = self._totals.setdefault((test_id, variant), _VariantTotals())
+        if ok:
+            totals.add(latency_ms)
+        else:
+            totals.errors += 1
+
+        if _request_counter is not None:
+            _request_counter.labels(
+                test_id=test_id, variant=variant, status="ok" if ok else "error"
+            ).inc()
+        if ok and _latency_histogram is not None:
+            _latency_histogram.labels(test_id=test_id, variant=variant).observe(latency_ms)
+            _latency_sq_counter.labels(test_id=test_id, variant=variant).inc(latency_ms * latency_ms)
+
+    def results(self, test: Optional[ABTest]) -> dict:
+        """Aggregated stats + Welch's t-test of each variant vs. the control."""
+        if test is None:
+            return {"enabled": False}
+
+        registry = _multiprocess_registry()
+        if registry is not None:
+            totals = _totals_from_registry(registry, test.test_id)
+        else:
+            totals = {
+                name: t for (test_id, name), t in self._totals.items() if test_id == test.test_id
+            }
+
+        per_variant = {v.name: totals.get(v.name, _VariantTotals()) for v in test.variants}
+        control_name = test.variants[0].name
+        control = per_variant[control_name]
+
+        return {
+            "enabled": True,
+            "test_id": test.test_id,
+            "control": control_name,
+            "workers": "all" if registry is not None else "this process",
+            "variants": {
+                name: {
+                    "requests": s.count,
+                    "errors": s.errors,
+                    "mean_latency_ms": round(s.mean, 2),
+                    "stddev_latency_ms": round(math.sqrt(s.variance), 2),
+                    "p50_latency_ms": _round(s.quantile(0.50)),
+                    "p95_latency_ms": _round(s.quantile(0.95)),
+                    "vs_control": None if name == control_name else welch_t_test(control, s),
+                }
+                for name, s in per_variant.items()
+            },
+        }
+
+    def clear(self) -> None:
+        self._totals.clear()
+
+
+# Shared instance used by pipeline.py / main.py
+ab_stats = ABStats()
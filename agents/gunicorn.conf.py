@@ -0,0 +1,98 @@
+# agents/gunicorn.conf.py
+"""
+Gunicorn config for the agents service (production entrypoint).
+
+Runs N Uvicorn workers so /generate can use every core instead of one
+GIL-bound process. UvicornWorker picks uvloop + httptools automatically
+(both ship with uvicorn[standard]).
+
+Per-process state: the response cache and the LangGraph MemorySaver used by
+/agent/run thread memory live inside each worker. Callers that rely on
+thread_id memory should set WEB_CONCURRENCY=1 or send conversation_history.
+
+Prometheus: when PROMETHEUS_MULTIPROC_DIR is set (the Dockerfile sets it),
+workers write metrics to files in that directory and /metrics aggregates
+them, so a scrape covers every worker rather than whichever one answered.
+
+Environment variables:
+  PORT                     - Bind port (default: 8000)
+  WEB_CONCURRENCY          - Worker count (default: 2 * container CPUs + 1,
+                             capped at MAX_DEFAULT_WORKERS)
+  GUNICORN_LOG_LEVEL       - Log level (default: warning)
+  PROMETHEUS_MULTIPROC_DIR - Shared metrics directory (wiped on start)
+"""
+
+import math
+import os
+import shutil
+
+# Upper bound for the computed default; set WEB_CONCURRENCY to go higher
+MAX_DEFAULT_WORKERS = 9
+
+
+def _container_cpus() -> int:
+    """CPUs available to this container: the cgroup quota, not the host count."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if quota > 0:
+                cpus = min(cpus, math.ceil(quota / period))
+        except (OSError, ValueError):
+            pass
+
+    return max(1, cpus)
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+workers = int(os.getenv(
+    "WEB_CONCURRENCY", str(min(2 * _container_cpus() + 1, MAX_DEFAULT_WORKERS))
+))
+worker_class = "uvicorn.workers.UvicornWorker"
+worker_connections = 1000
+
+# Outlive upstream load-balancer idle timeouts so keep-alive connections
+# from the Node.js orchestrator are not reset mid-call
+keepalive = 75
+timeout = 30
+graceful_timeout = 30
+
+# Access logging measurably costs throughput; app logs cover each request
+accesslog = None
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "warning")
+
+
+# ─── Prometheus multiprocess hooks ────────────────────────────────────────────
+
+
+def on_starting(server):
+    """Start each master run with an empty metrics directory."""
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        # Empty the directory in place; the Dockerfile pre-creates it
+        for name in os.listdir(metrics_dir):
+            path = os.path.join(metrics_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live-gauge files from the aggregate."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,55 @@
+# agents/http_client.py
+"""
+Shared HTTP client for LLM provider calls.
+
+Every voice turn makes one or two calls to SGLang / Kimi / OpenAI. Opening a
+fresh httpx.AsyncClient per call pays a TCP + TLS handshake each time; one
+process-wide client keeps HTTP/2 connections alive and multiplexes turns
+over them.
+
+Call-specific timeouts (e.g. the 500ms router budget) are passed per request.
+The client is closed from the FastAPI lifespan in main.py.
+"""
+
+from __future__ import annotations
+
+import socket
+from typing import Optional
+
+import httpx
+
+# Default budget for LLM completions; connect/pool fail fast so a dead
+# provider surfaces within the voice latency budget
+LLM_TIMEOUT = httpx.Timeout(60.0, connect=2.0, write=2.0, pool=1.0)
+
+LLM_LIMITS = httpx.Limits(
+    max_connections=200,
+    max_keepalive_connections=100,
+    keepalive_expiry=60.0,
+)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the shared AsyncClient."""
+    global _client
+
+    if _client is None or _client.is_closed:
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=LLM_LIMITS,
+            socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)],
+        )
+        _client = httpx.AsyncClient(transport=transport, timeout=LLM_TIMEOUT)
+
+    return _client
+
+
+async def aclose_http_client() -> None:
+    """Close the shared client (FastAPI shutdown)."""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
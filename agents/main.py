@@ -2,9 +2,12 @@
 main.py — FastAPI entrypoint for the Velox LLM agent service.
 
 Exposes:
-  POST /generate    →  run the LLM pipeline with tier-based routing (legacy)
-  POST /agent/run   →  run the LangGraph voice agent
-  GET  /health      →  liveness probe for Docker / Kubernetes
+  POST /generate        →  run the LLM pipeline with tier-based routing (legacy)
+  POST /generate/stream →  same pipeline, tokens streamed as server-sent events
+  POST /agent/run       →  run the LangGraph voice agent
+  GET  /health          →  liveness probe for Docker / Kubernetes
+  GET  /metrics         →  Prometheus metrics (LLM latency, response cache hits)
+  GET  /ab-results      →  per-variant stats + Welch's t-test for the A/B test
 
 Model Routing:
   T0 Router:  Qwen3.5-3B     → semantic intent classification
@@ -17,13 +20,28 @@ from __future__ import annotations
 
 import logging
 import os
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
+import orjson
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+from prometheus_client import multiprocess
 from pydantic import BaseModel, Field
 
-from pipeline import PipelineRequest, PipelineResponse, run_pipeline
+import ab_test
+from ab_test import ab_stats
+from http_client import aclose_http_client
+from pipeline import (
+    PipelineRequest,
+    PipelineResponse,
+    StreamInterrupted,
+    run_pipeline,
+    stream_pipeline,
+)
+from router import count_words_capped
 from voice_agent import run_voice_agent
 
 # ─── Logging ──────────────────────────────────────────────────────────────────
@@ -34,7 +52,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ─── App ──────────────────────────────────────────────────────────────────────
-app = FastAPI(title="Velox LLM Agent Service", version="2.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    yield
+    # Drain keep-alive connections to the LLM providers on shutdown
+    await aclose_http_client()
+
+
+app = FastAPI(title="Velox LLM Agent Service", version="2.0.0", lifespan=lifespan)
 
 
 # ─── Request / Response schemas ───────────────────────────────────────────────
@@ -97,7 +123,7 @@ class AgentResponse(BaseModel):
 # ─── Routes ───────────────────────────────────────────────────────────────────
 
 @app.post("/generate", response_model=GenerateResponse)
-async def generate(req: GenerateRequest) -> GenerateResponse:
+async def generate(req: GenerateRequest, response: Response) -> GenerateResponse:
     """
     Main inference endpoint called by the Node.js orchestrator.
     Routes to T1/T2/T3 tiers based on semantic classification.
@@ -109,7 +135,7 @@ async def generate(req: GenerateRequest) -> GenerateResponse:
         "Generating response | agent=%s conv=%s words=%d",
         req.agent_id,
         req.conversation_id,
-        len(req.user_message.split()),
+        count_words_capped(req.user_message),
     )
 
     pipeline_req = PipelineRequest(
@@ -122,10 +148,65 @@ async def generate(req: GenerateRequest) -> GenerateResponse:
 
     result: PipelineResponse = await run_pipeline(pipeline_req)
 
+    if result.ab_variant:
+        response.headers["X-AB-Test"] = result.ab_test
+        response.headers["X-AB-Variant"] = result.ab_variant
+
     logger.info("Response generated | model=%s", result.model_used)
     return GenerateResponse(response=result.response, model_used=result.model_used)
 
 
+@app.post("/generate/stream")
+async def generate_stream(req: GenerateRequest) -> StreamingResponse:
+    """
+    Streaming variant of /generate.
+
+    Emits `data: {"token": "..."}` events as the model decodes, then
+    `data: [DONE]`, so the orchestrator can start TTS on the first sentence.
+    If the provider fails mid-reply, an `event: error` is sent instead of
+    `[DONE]`.
+    The routed model is returned in the X-Model-Used / X-Model-Tier headers.
+    """
+    if not req.user_message.strip():
+        raise HTTPException(status_code=400, detail="user_message must not be empty")
+
+    logger.info(
+        "Streaming response | agent=%s conv=%s words=%d",
+        req.agent_id,
+        req.conversation_id,
+        count_words_capped(req.user_message),
+    )
+
+    stream = await stream_pipeline(PipelineRequest(
+        user_message=req.user_message,
+        context=req.context,
+        agent_id=req.agent_id,
+        conversation_id=req.conversation_id,
+        call_sid=req.call_sid,
+    ))
+
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in stream.chunks:
+                yield b"data: " + orjson.dumps({"token": chunk}) + b"\n\n"
+        except StreamInterrupted:
+            # No [DONE]: the reply is truncated and must not be spoken as final
+            yield b'event: error\ndata: {"error":"stream interrupted"}\n\n'
+            return
+        yield b"data: [DONE]\n\n"
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Model-Used": stream.model_used,
+        "X-Model-Tier": stream.tier,
+    }
+    if stream.ab_variant:
+        headers["X-AB-Test"] = stream.ab_test
+        headers["X-AB-Variant"] = stream.ab_variant
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
 @app.post("/agent/run", response_model=AgentResponse)
 async def agent_run(req: AgentRequest) -> AgentResponse:
     """
@@ -145,7 +226,7 @@ async def agent_run(req: AgentRequest) -> AgentResponse:
     logger.info(
         "Agent run | thread=%s words=%d history_turns=%d",
         req.thread_id or "none",
-        len(req.user_message.split()),
+        count_words_capped(req.user_message),
         len(req.conversation_history),
     )
 
@@ -185,6 +266,32 @@ async def health() -> dict:
     return {"status": "ok", "service": "velox-llm-agents"}
 
 
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Prometheus scrape endpoint (includes response cache hit/miss counters).
+
+    Under gunicorn (PROMETHEUS_MULTIPROC_DIR set) this aggregates every
+    worker's metrics; a single `python main.py` process uses the default registry.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/ab-results")
+async def ab_results() -> dict:
+    """
+    Latency stats per A/B variant with Welch's t-test against the control.
+
+    Aggregated across all gunicorn workers via the Prometheus multiprocess
+    directory; `python main.py` reports its single process.
+    """
+    return ab_stats.results(ab_test.AB_TEST)
+
+
 # ─── Entrypoint ───────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
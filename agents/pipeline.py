@@ -20,12 +20,19 @@ from __future__ import annotations
 
 import logging
 import os
+import time
 from dataclasses import dataclass
-from typing import Optional
+from functools import lru_cache
+from typing import AsyncIterator, Optional
 
-import httpx
+import orjson
 
+import ab_test
+from ab_test import ABAssignment
+from http_client import get_http_client
+from response_cache import RESPONSE_CACHE_ENABLED, response_cache
 from router import ModelTier, route_request, get_tier_model
+from tracing import cached_prompt_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -85,15 +92,67 @@ class PipelineResponse:
     model_used: str
     tier: str = ""
     latency_ms: float = 0.0
+    ab_test: str = ""
+    ab_variant: str = ""
+
+
+@dataclass
+class PipelineStream:
+    """A routed response whose text arrives incrementally via `chunks`."""
+
+    chunks: AsyncIterator[str]
+    model_used: str
+    tier: str = ""
+    ab_test: str = ""
+    ab_variant: str = ""
+
+
+class StreamInterrupted(Exception):
+    """Raised from PipelineStream.chunks when the provider fails mid-reply."""
+
+
+FALLBACK_RESPONSE = "I'm having trouble processing that right now. Please try again."
 
 
 # ─── OpenAI-compatible API call ───────────────────────────────────────────────
 
 
+def _chat_headers(api_key: str) -> dict:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
+
+def _chat_body(
+    user_message: str,
+    context: str,
+    model: str,
+    stream: bool = False,
+) -> bytes:
+    """
+    Serialize a /chat/completions request body.
+
+    The static persona leads the system message and the KB context follows,
+    so provider prefix caches can reuse the persona across every tenant.
+    """
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": _build_system_prompt(context)},
+            {"role": "user", "content": user_message},
+        ],
+        "temperature": 0.7,
+        "max_tokens": 256,
+    }
+    if stream:
+        body["stream"] = True
+    return orjson.dumps(body)
+
+
 async def _call_openai_compatible(
     user_message: str,
     context: str,
-    system_prompt: str,
     model: str,
     api_key: str,
     base_url: str = "https://api.openai.com/v1",
@@ -103,36 +162,67 @@ async def _call_openai_compatible(
 
     SGLang on Modal exposes the same /v1/chat/completions endpoint.
     """
-    full_system = system_prompt
-    if context:
-        full_system += f"\n\n=== KNOWLEDGE BASE ===\n{context}\n======================"
-
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.post(
-            f"{base_url}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": full_system},
-                    {"role": "user", "content": user_message},
-                ],
-                "temperature": 0.7,
-                "max_tokens": 256,
-            },
-        )
+    client = get_http_client()
+    resp = await client.post(
+        f"{base_url}/chat/completions",
+        headers=_chat_headers(api_key),
+        content=_chat_body(user_message, context, model),
+    )
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+
+    usage = data.get("usage") or {}
+    logger.debug(
+        "LLM usage: model=%s prompt_tokens=%d cached_tokens=%d",
+        model, usage.get("prompt_tokens") or 0, cached_prompt_tokens(usage)
+    )
+    return data["choices"][0]["message"]["content"]
+
+
+async def _stream_openai_compatible(
+    user_message: str,
+    context: str,
+    model: str,
+    api_key: str,
+    base_url: str = "https://api.openai.com/v1",
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of _call_openai_compatible — yields text deltas as the
+    provider decodes them (OpenAI-style server-sent events).
+
+    Servers that ignore `stream: true` and answer with a plain JSON body are
+    handled by yielding the whole completion as a single chunk.
+    """
+    client = get_http_client()
+    async with client.stream(
+        "POST",
+        f"{base_url}/chat/completions",
+        headers=_chat_headers(api_key),
+        content=_chat_body(user_message, context, model, stream=True),
+    ) as resp:
         resp.raise_for_status()
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
+
+        if not resp.headers.get("content-type", "").startswith("text/event-stream"):
+            data = orjson.loads(await resp.aread())
+            yield data["choices"][0]["message"]["content"]
+            return
+
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+
+            choices = orjson.loads(payload).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
 
 
 async def _call_sglang(
     user_message: str,
     context: str,
-    system_prompt: str,
     model: str,
 ) -> str:
     """
@@ -146,7 +236,6 @@ async def _call_sglang(
     return await _call_openai_compatible(
         user_message=user_message,
         context=context,
-        system_prompt=system_prompt,
         model=model,
         api_key=SGLANG_API_KEY,
         base_url=SGLANG_BASE_URL,
@@ -161,14 +250,37 @@ async def run_pipeline(req: PipelineRequest) -> PipelineResponse:
     Entry point called by main.py for every incoming /generate request.
 
     Routing logic:
+      0. Answer from the response cache if this utterance was seen before
+         (opt-in; skipped without an agent_id and for conversations enrolled
+         in an A/B test, see ab_test.py)
       1. Use semantic router (T0) to classify intent if SGLang is available
       2. Fall back to word count heuristic otherwise
       3. Route to T1 (Nemotron Nano), T2 (Qwen 32B), or T3 (Kimi K2.5)
+      4. Apply the A/B variant's tier/provider/model override, if any
     """
-    import time
-
     start_time = time.perf_counter()
-    system_prompt = _build_system_prompt("")
+
+    # ── A/B assignment (sticky per conversation) ──────────────────────────────
+    ab = ab_test.assign(req.conversation_id, req.agent_id)
+
+    # ── Response cache (skips routing + LLM entirely on hit) ──────────────────
+    # Enrolled requests bypass it so each variant is measured on its own model;
+    # requests without an agent_id have no tenant scope and are never cached
+    use_cache = RESPONSE_CACHE_ENABLED and ab is None and bool(req.agent_id)
+    if use_cache:
+        cached = await response_cache.get(req.agent_id, req.user_message, req.context)
+        if cached is not None:
+            total_latency_ms = (time.perf_counter() - start_time) * 1000
+            logger.info(
+                "Response cache hit: cache_tier=%s model=%s agent=%s total_ms=%.1f",
+                cached.cache_tier, cached.model_used, req.agent_id, total_latency_ms
+            )
+            return PipelineResponse(
+                response=cached.response,
+                model_used=cached.model_used,
+                tier=cached.tier,
+                latency_ms=total_latency_ms,
+            )
 
     # ── Route the request ─────────────────────────────────────────────────────
     routing_result = await route_request(req.user_message)
@@ -184,75 +296,22 @@ async def run_pipeline(req: PipelineRequest) -> PipelineResponse:
     )
 
     # ── Select provider and model based on tier ───────────────────────────────
-    try:
-        if LLM_PROVIDER == "sglang" and SGLANG_BASE_URL:
-            # SGLang for T1 and T2
-            if tier in (ModelTier.T1_FAST, ModelTier.T2_MEDIUM):
-                model = get_tier_model(tier, "sglang")
-                response_text = await _call_sglang(
-                    req.user_message,
-                    req.context,
-                    system_prompt,
-                    model,
-                )
-            else:
-                # T3 goes to Kimi K2.5
-                model = MODELS["kimi"]["powerful"]
-                response_text = await _call_openai_compatible(
-                    req.user_message,
-                    req.context,
-                    system_prompt,
-                    model,
-                    KIMI_API_KEY,
-                    KIMI_BASE_URL,
-                )
-
-        elif LLM_PROVIDER == "kimi":
-            # All tiers go through Kimi
-            if tier == ModelTier.T1_FAST:
-                model = MODELS["kimi"]["fast"]
-            elif tier == ModelTier.T2_MEDIUM:
-                model = MODELS["kimi"]["balanced"]
-            else:
-                model = MODELS["kimi"]["powerful"]
+    tier, provider, model, api_key, base_url = _select_target(req, tier, ab)
 
-            response_text = await _call_openai_compatible(
-                req.user_message,
-                req.context,
-                system_prompt,
-                model,
-                KIMI_API_KEY,
-                KIMI_BASE_URL,
-            )
-
-        elif LLM_PROVIDER == "openai":
-            # All tiers go through OpenAI
-            if tier == ModelTier.T1_FAST:
-                model = MODELS["openai"]["fast"]
-            elif tier == ModelTier.T2_MEDIUM:
-                model = MODELS["openai"]["balanced"]
-            else:
-                model = MODELS["openai"]["powerful"]
-
-            response_text = await _call_openai_compatible(
+    try:
+        if provider == "sglang":
+            response_text = await _call_sglang(
                 req.user_message,
                 req.context,
-                system_prompt,
                 model,
-                OPENAI_API_KEY,
-                "https://api.openai.com/v1",
             )
-
         else:
-            # Default fallback to Kimi
-            model = MODELS["kimi"]["fast"]
             response_text = await _call_openai_compatible(
                 req.user_message,
                 req.context,
-                system_prompt,
                 model,
-                KIMI_API_KEY,
-                KIMI_BASE_URL,
+                api_key,
+                base_url,
             )
 
         total_latency_ms = (time.perf_counter() - start_time) * 1000
@@ -261,34 +320,218 @@ async def run_pipeline(req: PipelineRequest) -> PipelineResponse:
             model, tier.value, total_latency_ms
         )
 
+        if ab is not None:
+            ab.record(total_latency_ms)
+
+        if use_cache:
+            await response_cache.put(
+                req.agent_id,
+                req.user_message,
+                req.context,
+                response_text,
+                model,
+                tier.value,
+            )
+
         return PipelineResponse(
             response=response_text,
             model_used=model,
             tier=tier.value,
             latency_ms=total_latency_ms,
+            ab_test=ab.test_id if ab is not None else "",
+            ab_variant=ab.variant.name if ab is not None else "",
         )
 
     except Exception as exc:
         logger.error("LLM call failed: %s", exc)
         total_latency_ms = (time.perf_counter() - start_time) * 1000
 
+        if ab is not None:
+            ab.record(total_latency_ms, ok=False)
+
         return PipelineResponse(
-            response="I'm having trouble processing that right now. Please try again.",
+            response=FALLBACK_RESPONSE,
             model_used=f"{LLM_PROVIDER} (error)",
             tier=tier.value,
             latency_ms=total_latency_ms,
+            ab_test=ab.test_id if ab is not None else "",
+            ab_variant=ab.variant.name if ab is not None else "",
         )
 
 
+async def stream_pipeline(req: PipelineRequest) -> PipelineStream:
+    """
+    Streaming counterpart of run_pipeline, used by POST /generate/stream.
+
+    Routing, A/B assignment and the response cache behave exactly as in
+    run_pipeline; the returned stream yields text as the model decodes it, so
+    TTS can start on the first tokens instead of waiting for the full reply.
+    """
+    start_time = time.perf_counter()
+
+    ab = ab_test.assign(req.conversation_id, req.agent_id)
+    use_cache = RESPONSE_CACHE_ENABLED and ab is None and bool(req.agent_id)
+
+    if use_cache:
+        cached = await response_cache.get(req.agent_id, req.user_message, req.context)
+        if cached is not None:
+            logger.info(
+                "Response cache hit (stream): cache_tier=%s model=%s agent=%s",
+                cached.cache_tier, cached.model_used, req.agent_id
+            )
+            return PipelineStream(
+                chunks=_single_chunk(cached.response),
+                model_used=cached.model_used,
+                tier=cached.tier,
+            )
+
+    routing_result = await route_request(req.user_message)
+    tier, provider, model, api_key, base_url = _select_target(req, routing_result.tier, ab)
+
+    logger.info(
+        "Route (stream): tier=%s intent=%s routing_ms=%.1f provider=%s model=%s",
+        tier.value,
+        routing_result.intent,
+        routing_result.latency_ms,
+        provider,
+        model,
+    )
+
+    async def chunks() -> AsyncIterator[str]:
+        parts: list[str] = []
+        try:
+            async for delta in _stream_openai_compatible(
+                req.user_message,
+                req.context,
+                model,
+                api_key,
+                base_url,
+            ):
+                if not parts:
+                    logger.info(
+                        "First token: model=%s ttft_ms=%.1f",
+                        model, (time.perf_counter() - start_time) * 1000
+                    )
+                parts.append(delta)
+                yield delta
+        except Exception as exc:
+            logger.error("LLM stream failed after %d chunks: %s", len(parts), exc)
+            if ab is not None:
+                ab.record((time.perf_counter() - start_time) * 1000, ok=False)
+            if not parts:
+                yield FALLBACK_RESPONSE
+                return
+            # Text already went out — let the caller flag the reply as truncated
+            raise StreamInterrupted(str(exc)) from exc
+
+        total_latency_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(
+            "Response streamed: model=%s tier=%s total_ms=%.1f",
+            model, tier.value, total_latency_ms
+        )
+
+        if ab is not None:
+            ab.record(total_latency_ms)
+
+        if use_cache and parts:
+            await response_cache.put(
+                req.agent_id,
+                req.user_message,
+                req.context,
+                "".join(parts),
+                model,
+                tier.value,
+            )
+
+    return PipelineStream(
+        chunks=chunks(),
+        model_used=model,
+        tier=tier.value,
+        ab_test=ab.test_id if ab is not None else "",
+        ab_variant=ab.variant.name if ab is not None else "",
+    )
+
+
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
 
-def _build_system_prompt(context: str) -> str:
-    base = (
-        "You are Velox, a professional voice AI assistant. "
-        "Keep answers concise — under two sentences. "
-        "Do not use markdown formatting; your reply will be spoken aloud."
+def _select_target(
+    req: PipelineRequest, tier: ModelTier, ab: Optional[ABAssignment]
+) -> tuple[ModelTier, str, str, str, str]:
+    """
+    Apply the A/B variant's overrides (if any) to the routed tier and pick
+    (tier, provider, model, api_key, base_url).
+    """
+    if ab is None:
+        return (tier, *_resolve_target(tier))
+
+    variant = ab.variant
+    tier = variant.tier or tier
+    logger.info(
+        "A/B: test=%s variant=%s conv=%s tier=%s",
+        ab.test_id, variant.name, req.conversation_id, tier.value
     )
-    if context:
-        return f"{base}\n\n=== KNOWLEDGE BASE ===\n{context}\n======================\n"
-    return base
+
+    if variant.model:
+        return (tier, variant.provider, variant.model, *_provider_endpoint(variant.provider))
+    return (tier, *_resolve_target(tier, variant.provider))
+
+
+def _provider_endpoint(provider: str) -> tuple[str, str]:
+    """(api_key, base_url) for a provider."""
+    if provider == "sglang":
+        return SGLANG_API_KEY, SGLANG_BASE_URL
+    if provider == "openai":
+        return OPENAI_API_KEY, "https://api.openai.com/v1"
+    return KIMI_API_KEY, KIMI_BASE_URL
+
+
+def _resolve_target(
+    tier: ModelTier, provider: Optional[str] = None
+) -> tuple[str, str, str, str]:
+    """
+    Pick (provider, model, api_key, base_url) for a routed tier.
+
+    `provider` defaults to LLM_PROVIDER; A/B variants may override it.
+    """
+    provider = provider or LLM_PROVIDER
+
+    if provider == "sglang" and SGLANG_BASE_URL:
+        # SGLang for T1 and T2
+        if tier in (ModelTier.T1_FAST, ModelTier.T2_MEDIUM):
+            return ("sglang", get_tier_model(tier, "sglang"), *_provider_endpoint("sglang"))
+        # T3 goes to Kimi K2.5
+        return ("kimi", MODELS["kimi"]["powerful"], *_provider_endpoint("kimi"))
+
+    if provider in ("kimi", "openai"):
+        # All tiers go through the configured provider
+        if tier == ModelTier.T1_FAST:
+            size = "fast"
+        elif tier == ModelTier.T2_MEDIUM:
+            size = "balanced"
+        else:
+            size = "powerful"
+
+        return (provider, MODELS[provider][size], *_provider_endpoint(provider))
+
+    # Default fallback to Kimi
+    return ("kimi", MODELS["kimi"]["fast"], *_provider_endpoint("kimi"))
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+# System prompt pieces, built once at import
+_BASE = (
+    "You are Velox, a professional voice AI assistant. "
+    "Keep answers concise — under two sentences. "
+    "Do not use markdown formatting; your reply will be spoken aloud."
+)
+_KB_PFX = "\n\n=== KNOWLEDGE BASE ===\n"
+_KB_SFX = "\n======================\n"
+
+
+@lru_cache(maxsize=2048)
+def _build_system_prompt(context: str) -> str:
+    return _BASE if not context else "".join((_BASE, _KB_PFX, context, _KB_SFX))
@@ -0,0 +1,331 @@
+# agents/response_cache.py
+"""
+Two-tier response cache in front of the LLM pipeline.
+
+Short voice utterances ("hello", "yes please", "thanks") repeat constantly
+across calls for the same agent. Answering them from cache skips the router
+and the LLM round-trip entirely.
+
+Tiers:
+  1. Exact:    in-process LRU keyed on
+               sha256(agent_id \\x00 normalized message \\x00 context hash)
+  2. Semantic: all-MiniLM-L6-v2 embeddings in a FAISS IndexFlatIP, scoped
+               per (agent_id, context hash) so tenants never share answers.
+               Optional — enabled with RESPONSE_CACHE_SEMANTIC=true and only
+               when sentence-transformers + faiss are installed.
+
+The cache is per-process; each worker keeps its own copy. It is off by
+default: once enabled, an agent's identical utterance is answered with the
+same reply for RESPONSE_CACHE_TTL_S. Requests without an agent_id are never
+cached, since they would all share one scope.
+
+Environment variables:
+  RESPONSE_CACHE_ENABLED     - Enable the cache (default: false)
+  RESPONSE_CACHE_MAX_ENTRIES - Exact-tier LRU capacity (default: 10000)
+  RESPONSE_CACHE_TTL_S       - Entry lifetime in seconds (default: 3600)
+  RESPONSE_CACHE_SEMANTIC    - Enable the semantic tier (default: false)
+  RESPONSE_CACHE_THRESHOLD   - Cosine similarity for a semantic hit (default: 0.95)
+  RESPONSE_CACHE_EMBED_MODEL - Sentence-transformers model
+                               (default: sentence-transformers/all-MiniLM-L6-v2)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ────────────────────────────────────────────────────────────
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "3600"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_EMBED_MODEL = os.getenv(
+    "RESPONSE_CACHE_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+
+# Max semantic entries kept per (agent_id, context) scope
+SEMANTIC_MAX_ENTRIES_PER_SCOPE = 1000
+
+# Semantic tier dependencies are optional
+try:
+    import faiss
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_AVAILABLE = True
+except ImportError:
+    SEMANTIC_AVAILABLE = False
+
+
+@dataclass
+class CachedResponse:
+    """A cached pipeline answer."""
+
+    response: str
+    model_used: str
+    tier: str
+    cache_tier: str  # exact | semantic
+    expires_at: float
+
+
+# ─── Key helpers ──────────────────────────────────────────────────────────────
+
+
+def normalize_message(user_message: str) -> str:
+    """Lower-case and collapse whitespace so trivial variants share a key."""
+    return " ".join(user_message.lower().split())
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(agent_id: str, user_message: str, context: str) -> str:
+    raw = "\x00".join((agent_id, normalize_message(user_message), context_hash(context)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ─── Prometheus Metrics ───────────────────────────────────────────────────────
+
+_metrics_initialized = False
+_cache_hit_counter = None
+_cache_miss_counter = None
+
+
+def _init_metrics():
+    """Initialize Prometheus metrics (lazy)."""
+    global _metrics_initialized, _cache_hit_counter, _cache_miss_counter
+
+    if _metrics_initialized:
+        return
+
+    try:
+        from prometheus_client import Counter
+
+        _cache_hit_counter = Counter(
+            "response_cache_hits_total",
+            "Number of pipeline requests answered from the response cache",
+            ["cache_tier"],
+        )
+
+        _cache_miss_counter = Counter(
+            "response_cache_misses_total",
+            "Number of pipeline requests that missed the response cache",
+        )
+
+    except ImportError:
+        logger.debug("prometheus_client not available, cache metrics disabled")
+
+    _metrics_initialized = True
+
+
+# ─── Semantic tier ────────────────────────────────────────────────────────────
+
+
+class _SemanticIndex:
+    """Per-scope FAISS inner-product index over normalized embeddings."""
+
+    def __init__(self, model_name: str, threshold: float):
+        self.model_name = model_name
+        self.threshold = threshold
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._indexes: dict[str, "faiss.IndexFlatIP"] = {}
+        self._entries: dict[str, list[CachedResponse]] = {}
+        self._lock = threading.Lock()
+
+    def _encode(self, text: str):
+        if self._model is None:
+            # Concurrent to_thread calls must not each load the model
+            with self._model_lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        vec = self._model.encode([text], normalize_embeddings=True)
+        return np.asarray(vec, dtype="float32")
+
+    def search(self, scope: str, message: str, now: float) -> Optional[CachedResponse]:
+        """Blocking — call via asyncio.to_thread."""
+        if scope not in self._indexes:
+            return None
+
+        vec = self._encode(message)
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None or index.ntotal == 0:
+                return None
+            scores, ids = index.search(vec, 1)
+            score, idx = float(scores[0][0]), int(ids[0][0])
+            if idx < 0 or score < self.threshold:
+                return None
+            entry = self._entries[scope][idx]
+            return entry if entry.expires_at > now else None
+
+    def add(self, scope: str, message: str, entry: CachedResponse) -> None:
+        """Blocking — call via asyncio.to_thread."""
+        vec = self._encode(message)
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                index = faiss.IndexFlatIP(vec.shape[1])
+                self._indexes[scope] = index
+                self._entries[scope] = []
+
+            entries = self._entries[scope]
+            if len(entries) >= SEMANTIC_MAX_ENTRIES_PER_SCOPE:
+                # IndexFlat compacts ids on removal, keeping entries aligned
+                index.remove_ids(np.array([0], dtype="int64"))
+                entries.pop(0)
+
+            index.add(vec)
+            entries.append(entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+
+
+# ─── Response Cache ───────────────────────────────────────────────────────────
+
+
+class ResponseCache:
+    """
+    Exact LRU + optional semantic cache for pipeline responses.
+
+    Example:
+        cached = await cache.get(agent_id, user_message, context)
+        if cached is None:
+            ...  # run the pipeline
+            await cache.put(agent_id, user_message, context, text, model, tier)
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_s: float = RESPONSE_CACHE_TTL_S,
+        enable_semantic: bool = RESPONSE_CACHE_SEMANTIC,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        embed_model: str = RESPONSE_CACHE_EMBED_MODEL,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._exact: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._semantic: Optional[_SemanticIndex] = None
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+        if enable_semantic:
+            if SEMANTIC_AVAILABLE:
+                self._semantic = _SemanticIndex(embed_model, threshold)
+            else:
+                logger.warning(
+                    "RESPONSE_CACHE_SEMANTIC=true but sentence-transformers/faiss "
+                    "are not installed — semantic tier disabled"
+                )
+
+    async def get(
+        self, agent_id: str, user_message: str, context: str = ""
+    ) -> Optional[CachedResponse]:
+        """Look up a cached response; returns None on miss."""
+        _init_metrics()
+        now = time.monotonic()
+        key = make_cache_key(agent_id, user_message, context)
+
+        entry = self._exact.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._exact.move_to_end(key)
+                return self._record_hit(entry)
+            del self._exact[key]
+
+        if self._semantic is not None:
+            scope = f"{agent_id}\x00{context_hash(context)}"
+            try:
+                entry = await asyncio.to_thread(
+                    self._semantic.search, scope, normalize_message(user_message), now
+                )
+            except Exception as exc:
+                logger.warning("Semantic cache lookup failed: %s", exc)
+                entry = None
+            if entry is not None:
+                return self._record_hit(CachedResponse(
+                    response=entry.response,
+                    model_used=entry.model_used,
+                    tier=entry.tier,
+                    cache_tier="semantic",
+                    expires_at=entry.expires_at,
+                ))
+
+        self.misses += 1
+        if _cache_miss_counter is not None:
+            _cache_miss_counter.inc()
+        return None
+
+    async def put(
+        self,
+        agent_id: str,
+        user_message: str,
+        context: str,
+        response: str,
+        model_used: str,
+        tier: str = "",
+    ) -> None:
+        """Store a pipeline response in both tiers."""
+        entry = CachedResponse(
+            response=response,
+            model_used=model_used,
+            tier=tier,
+            cache_tier="exact",
+            expires_at=time.monotonic() + self.ttl_s,
+        )
+
+        key = make_cache_key(agent_id, user_message, context)
+        self._exact[key] = entry
+        self._exact.move_to_end(key)
+        while len(self._exact) > self.max_entries:
+            self._exact.popitem(last=False)
+
+        if self._semantic is not None:
+            scope = f"{agent_id}\x00{context_hash(context)}"
+            try:
+                await asyncio.to_thread(
+                    self._semantic.add, scope, normalize_message(user_message), entry
+                )
+            except Exception as exc:
+                logger.warning("Semantic cache insert failed: %s", exc)
+
+    def clear(self) -> None:
+        self._exact.clear()
+        if self._semantic is not None:
+            self._semantic.clear()
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "semantic_enabled": self._semantic is not None,
+            "entries": len(self._exact),
+            "hits": dict(self.hits),
+            "misses": self.misses,
+        }
+
+    def _record_hit(self, entry: CachedResponse) -> CachedResponse:
+        self.hits[entry.cache_tier] += 1
+        if _cache_hit_counter is not None:
+            _cache_hit_counter.labels(cache_tier=entry.cache_tier).inc()
+        return entry
+
+
+# Shared instance used by pipeline.py
+response_cache = ResponseCache()
@@ -15,12 +15,15 @@ from __future__ import annotations
 
 import logging
 import os
+import re
 import time
 from dataclasses import dataclass
 from enum import Enum
 from typing import Optional
 
-import httpx
+import orjson
+
+from http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -106,6 +109,24 @@ INTENT_TO_TIER = {
 T1_MAX_WORDS = int(os.getenv("T1_MAX_WORDS", "15"))
 T2_MAX_WORDS = int(os.getenv("T2_MAX_WORDS", "50"))
 
+_WORD_RE = re.compile(r"\S+")
+
+
+def count_words_capped(text: str, cap: int = T2_MAX_WORDS) -> int:
+    """
+    Count whitespace-separated words, stopping once `cap` is reached.
+
+    Routing only needs to know which threshold a message falls under, so
+    long messages are not scanned (or split into a throwaway list) past
+    the last threshold.
+    """
+    count = 0
+    for _ in _WORD_RE.finditer(text):
+        count += 1
+        if count >= cap:
+            break
+    return count
+
 
 def route_by_word_count(word_count: int) -> ModelTier:
     """Fallback routing based on word count."""
@@ -135,31 +156,32 @@ async def classify_intent(user_message: str, timeout: float = 0.5) -> Optional[s
         return None
 
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            resp = await client.post(
-                f"{SGLANG_BASE_URL}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {SGLANG_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": ROUTER_MODEL,
-                    "messages": [
-                        {"role": "system", "content": ROUTER_SYSTEM_PROMPT},
-                        {"role": "user", "content": user_message},
-                    ],
-                    "temperature": 0.0,  # Deterministic classification
-                    "max_tokens": 20,    # Intent names are short
-                },
-            )
-            resp.raise_for_status()
-            data = resp.json()
-
-            intent = data["choices"][0]["message"]["content"].strip().lower()
-            # Clean up any extra text
-            intent = intent.split()[0] if intent else ""
-
-            return intent if intent in INTENT_TO_TIER else None
+        client = get_http_client()
+        resp = await client.post(
+            f"{SGLANG_BASE_URL}/chat/completions",
+            headers={
+                "Authorization": f"Bearer {SGLANG_API_KEY}",
+                "Content-Type": "application/json",
+            },
+            content=orjson.dumps({
+                "model": ROUTER_MODEL,
+                "messages": [
+                    {"role": "system", "content": ROUTER_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_message},
+                ],
+                "temperature": 0.0,  # Deterministic classification
+                "max_tokens": 20,    # Intent names are short
+            }),
+            timeout=timeout,
+        )
+        resp.raise_for_status()
+        data = orjson.loads(resp.content)
+
+        intent = data["choices"][0]["message"]["content"].strip().lower()
+        # Clean up any extra text
+        intent = intent.split()[0] if intent else ""
+
+        return intent if intent in INTENT_TO_TIER else None
 
     except Exception as exc:
         logger.warning("Intent classification failed: %s", exc)
@@ -180,7 +202,6 @@ async def route_request(user_message: str) -> RoutingResult:
         RoutingResult with tier, intent, confidence, and latency
     """
     start_time = time.perf_counter()
-    word_count = len(user_message.split())
 
     # Try semantic classification first
     if ENABLE_SEMANTIC_ROUTER:
@@ -203,6 +224,7 @@ async def route_request(user_message: str) -> RoutingResult:
             )
 
     # Fallback to word count heuristic
+    word_count = count_words_capped(user_message)
     tier = route_by_word_count(word_count)
     latency_ms = (time.perf_counter() - start_time) * 1000
 
@@ -219,6 +241,21 @@ async def route_request(user_message: str) -> RoutingResult:
     )
 
 
+# Resolved once at import — get_tier_model runs on every turn
+TIER_MODELS: dict[str, dict[ModelTier, str]] = {
+    "sglang": {
+        ModelTier.T1_FAST: os.getenv("SGLANG_MODEL_T1", "nvidia/Nemotron-3-Nano-4B-Instruct"),
+        ModelTier.T2_MEDIUM: os.getenv("SGLANG_MODEL_T2", "Qwen/Qwen2.5-32B-Instruct"),
+        ModelTier.T3_HEAVY: os.getenv("SGLANG_MODEL_T2", "Qwen/Qwen2.5-32B-Instruct"),  # Fallback
+    },
+    "kimi": {
+        ModelTier.T1_FAST: os.getenv("KIMI_MODEL_FAST", "moonshot-v1-8k"),
+        ModelTier.T2_MEDIUM: os.getenv("KIMI_MODEL", "moonshot-v1-32k"),
+        ModelTier.T3_HEAVY: os.getenv("KIMI_MODEL_POWERFUL", "kimi-k2.5"),
+    },
+}
+
+
 def get_tier_model(tier: ModelTier, provider: str = "sglang") -> str:
     """
     Get the model ID for a given tier and provider.
@@ -230,18 +267,5 @@ def get_tier_model(tier: ModelTier, provider: str = "sglang") -> str:
     Returns:
         Model ID string
     """
-    TIER_MODELS = {
-        "sglang": {
-            ModelTier.T1_FAST: os.getenv("SGLANG_MODEL_T1", "nvidia/Nemotron-3-Nano-4B-Instruct"),
-            ModelTier.T2_MEDIUM: os.getenv("SGLANG_MODEL_T2", "Qwen/Qwen2.5-32B-Instruct"),
-            ModelTier.T3_HEAVY: os.getenv("SGLANG_MODEL_T2", "Qwen/Qwen2.5-32B-Instruct"),  # Fallback
-        },
-        "kimi": {
-            ModelTier.T1_FAST: os.getenv("KIMI_MODEL_FAST", "moonshot-v1-8k"),
-            ModelTier.T2_MEDIUM: os.getenv("KIMI_MODEL", "moonshot-v1-32k"),
-            ModelTier.T3_HEAVY: os.getenv("KIMI_MODEL_POWERFUL", "kimi-k2.5"),
-        },
-    }
-
     provider_models = TIER_MODELS.get(provider, TIER_MODELS["sglang"])
     return provider_models.get(tier, provider_models[ModelTier.T1_FAST])
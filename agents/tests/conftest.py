@@ -13,6 +13,15 @@ os.environ["GEMINI_API_KEY"] = "test-key"
 os.environ["PHI3_SERVICE_URL"] = ""
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Keep cached pipeline answers from leaking between tests."""
+    from response_cache import response_cache
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+
 @pytest.fixture
 def mock_gemini_response():
     """Mock response from Gemini API."""
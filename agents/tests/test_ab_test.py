@@ -0,0 +1,331 @@
+"""
+test_ab_test.py — Unit tests for the A/B traffic split.
+
+Tests:
+  - AB_CONFIG parsing
+  - Sticky, weighted variant assignment
+  - Welch's t-test, latency quantiles and /ab-results aggregation
+  - run_pipeline / stream_pipeline overrides and /generate(/stream) headers
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from ab_test import (
+    ABStats,
+    _totals_from_registry,
+    _VariantTotals,
+    choose_variant,
+    load_ab_config,
+    student_t_two_sided_p,
+    welch_t_test,
+)
+from main import app
+from pipeline import PipelineRequest, PipelineResponse, PipelineStream, run_pipeline, stream_pipeline
+from router import ModelTier, RoutingResult
+
+CONFIG = """
+{"test_id": "t1-vs-t2",
+ "variants": [
+   {"name": "control", "weight": 50},
+   {"name": "t2", "weight": 50, "tier": "t2_medium", "provider": "kimi", "model": "moonshot-v1-32k"}
+ ]}
+"""
+
+
+@pytest.fixture
+def ab_config():
+    return load_ab_config(CONFIG)
+
+
+class TestLoadConfig:
+    """Tests for AB_CONFIG parsing."""
+
+    def test_parses_variants(self, ab_config):
+        assert ab_config.test_id == "t1-vs-t2"
+        assert [v.name for v in ab_config.variants] == ["control", "t2"]
+        assert ab_config.variants[1].tier == ModelTier.T2_MEDIUM
+
+    def test_empty_disables(self):
+        assert load_ab_config("") is None
+
+    def test_invalid_disables(self):
+        assert load_ab_config("{not json") is None
+        assert load_ab_config('{"test_id": "x", "variants": [{"name": "a", "weight": 0}]}') is None
+
+    def test_model_requires_provider(self):
+        assert load_ab_config('{"test_id": "x", "variants": [{"name": "a", "weight": 1, "model": "gpt-4o-mini"}]}') is None
+
+    def test_negative_weight(self):
+        config = (
+            '{"test_id": "x", "variants": ['
+            '{"name": "a", "weight": 5}, {"name": "b", "weight": -1}]}'
+        )
+        assert load_ab_config(config) is None
+
+    def test_unknown_provider(self):
+        assert load_ab_config('{"test_id": "x", "variants": [{"name": "a", "weight": 1, "provider": "acme"}]}') is None
+
+    def test_agent_filter(self):
+        test = load_ab_config('{"test_id": "x", "agent_ids": ["a1"], "variants": [{"name": "a", "weight": 1}]}')
+        assert test.applies_to("a1")
+        assert not test.applies_to("a2")
+
+
+class TestChooseVariant:
+    """Tests for sticky weighted assignment."""
+
+    def test_sticky_per_conversation(self, ab_config):
+        first = choose_variant("conv-1", ab_config)
+        assert all(choose_variant("conv-1", ab_config) is first for _ in range(10))
+
+    def test_respects_weights(self, ab_config):
+        names = [choose_variant(f"conv-{i}", ab_config).name for i in range(2000)]
+        assert 0.4 < names.count("t2") / len(names) < 0.6
+
+    def test_zero_weight_never_chosen(self):
+        test = load_ab_config('{"test_id": "x", "variants": [{"name": "a", "weight": 1}, {"name": "b", "weight": 0}]}')
+        assert {choose_variant(f"c{i}", test).name for i in range(200)} == {"a"}
+
+
+class TestStats:
+    """Tests for Welch's t-test and result aggregation."""
+
+    @staticmethod
+    def _stats(values):
+        s = _VariantTotals()
+        for v in values:
+            s.add(v)
+        return s
+
+    def test_running_stats_match_sample_variance(self):
+        s = self._stats([100.0, 200.0, 300.0])
+        assert s.mean == pytest.approx(200.0)
+        assert s.variance == pytest.approx(10000.0)
+
+    def test_clear_difference_is_significant(self):
+        a = self._stats([100 + i % 5 for i in range(50)])
+        b = self._stats([200 + i % 5 for i in range(50)])
+        result = welch_t_test(a, b)
+        assert result["delta_ms"] == pytest.approx(100.0)
+        assert result["p_value"] < 0.001
+
+    def test_same_distribution_is_not_significant(self):
+        a = self._stats([100 + i % 5 for i in range(50)])
+        b = self._stats([100 + (i + 2) % 5 for i in range(50)])
+        assert welch_t_test(a, b)["p_value"] > 0.5
+
+    @pytest.mark.parametrize("t, df, expected", [
+        (2.0, 10, 0.0734),
+        (2.228, 10, 0.0500),
+        (1.0, 1, 0.5000),
+        (2.0, 1000, 0.0458),
+    ])
+    def test_student_t_p_value(self, t, df, expected):
+        assert student_t_two_sided_p(t, df) == pytest.approx(expected, abs=5e-4)
+
+    def test_small_samples_use_t_distribution(self):
+        # t = 1.8 on ~6 df: p ≈ 0.12, where the normal approximation gives ≈ 0.07
+        a = self._stats([100.0, 110.0, 120.0, 105.0])
+        b = self._stats([110.0, 125.0, 115.0, 130.0])
+        result = welch_t_test(a, b)
+        assert result["t"] == pytest.approx(1.8)
+        assert result["p_value"] > 0.1
+
+    def test_too_few_samples(self):
+        assert welch_t_test(self._stats([1.0]), self._stats([2.0, 3.0])) is None
+
+    def test_results_per_variant(self, ab_config):
+        stats = ABStats()
+        for i in range(10):
+            stats.record("t1-vs-t2", "control", 100.0 + i)
+            stats.record("t1-vs-t2", "t2", 150.0 + i)
+        stats.record("t1-vs-t2", "t2", 0.0, ok=False)
+
+        results = stats.results(ab_config)
+        assert results["control"] == "control"
+        assert results["variants"]["t2"]["requests"] == 10
+        assert results["variants"]["t2"]["errors"] == 1
+        assert results["variants"]["control"]["vs_control"] is None
+        assert results["variants"]["t2"]["vs_control"]["delta_ms"] == pytest.approx(50.0)
+        assert results["variants"]["control"]["p50_latency_ms"] == pytest.approx(144.4)
+        assert results["variants"]["t2"]["p95_latency_ms"] == pytest.approx(195.0)
+
+    def test_quantiles_interpolate_within_buckets(self):
+        s = self._stats([60.0] * 50 + [250.0] * 50)
+        assert s.quantile(0.50) == pytest.approx(100.0)
+        assert s.quantile(0.95) == pytest.approx(290.0)
+
+    def test_quantile_above_last_bucket_reports_last_bound(self):
+        assert self._stats([9000.0] * 10).quantile(0.95) == pytest.approx(5000.0)
+
+    def test_quantile_empty(self):
+        assert _VariantTotals().quantile(0.5) is None
+
+    def test_registry_totals_match_in_process_totals(self):
+        stats = ABStats()
+        for i in range(5):
+            stats.record("registry-test", "control", 100.0 + i)
+        stats.record("registry-test", "control", 0.0, ok=False)
+
+        totals = _totals_from_registry(REGISTRY, "registry-test")["control"]
+        assert totals.count == 5
+        assert totals.errors == 1
+        assert totals.mean == pytest.approx(102.0)
+        assert totals.variance == pytest.approx(2.5)
+        assert totals.buckets == stats._totals[("registry-test", "control")].buckets
+
+    def test_results_disabled(self):
+        assert ABStats().results(None) == {"enabled": False}
+
+
+class TestPipelineOverride:
+    """Tests for the A/B override inside run_pipeline."""
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._call_openai_compatible")
+    async def test_variant_overrides_tier_and_model(self, mock_call, mock_route, ab_config):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        mock_call.return_value = "Hello!"
+        conv_id = next(f"c{i}" for i in range(100) if choose_variant(f"c{i}", ab_config).name == "t2")
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"), patch("ab_test.AB_TEST", ab_config):
+            result = await run_pipeline(PipelineRequest(user_message="Hi", conversation_id=conv_id))
+
+        assert result.ab_test == "t1-vs-t2"
+        assert result.ab_variant == "t2"
+        assert result.tier == "t2_medium"
+        assert result.model_used == "moonshot-v1-32k"
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._call_openai_compatible")
+    async def test_variant_model_uses_its_provider_endpoint(self, mock_call, mock_route):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        mock_call.return_value = "Hello!"
+        test = load_ab_config(
+            '{"test_id": "x", "variants": ['
+            '{"name": "mini", "weight": 1, "provider": "openai", "model": "gpt-4o-mini"}]}'
+        )
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"), patch("ab_test.AB_TEST", test):
+            result = await run_pipeline(PipelineRequest(user_message="Hi", conversation_id="c1"))
+
+        assert result.model_used == "gpt-4o-mini"
+        assert mock_call.call_args.args[2] == "gpt-4o-mini"
+        assert mock_call.call_args.args[4] == "https://api.openai.com/v1"
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._call_openai_compatible")
+    async def test_enrolled_requests_bypass_cache(self, mock_call, mock_route, ab_config):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        mock_call.return_value = "Hello!"
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"), patch("ab_test.AB_TEST", ab_config):
+            await run_pipeline(PipelineRequest(user_message="Hi", conversation_id="c1"))
+            await run_pipeline(PipelineRequest(user_message="Hi", conversation_id="c1"))
+
+        assert mock_call.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._stream_openai_compatible")
+    async def test_stream_applies_variant_and_records(self, mock_stream, mock_route, ab_config):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+
+        async def deltas(*args, **kwargs):
+            yield "Hello!"
+
+        mock_stream.side_effect = deltas
+        conv_id = next(f"c{i}" for i in range(100) if choose_variant(f"c{i}", ab_config).name == "t2")
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"), patch("ab_test.AB_TEST", ab_config), \
+                patch("ab_test.ab_stats") as mock_stats:
+            stream = await stream_pipeline(PipelineRequest(user_message="Hi", conversation_id=conv_id))
+            chunks = [chunk async for chunk in stream.chunks]
+
+        assert chunks == ["Hello!"]
+        assert (stream.ab_test, stream.ab_variant) == ("t1-vs-t2", "t2")
+        assert stream.tier == "t2_medium"
+        assert stream.model_used == "moonshot-v1-32k"
+        mock_stats.record.assert_called_once()
+        assert mock_stats.record.call_args.args[:2] == ("t1-vs-t2", "t2")
+
+
+class TestEndpoints:
+    """Tests for A/B headers and GET /ab-results."""
+
+    client = TestClient(app)
+
+    @patch("main.run_pipeline")
+    def test_generate_sets_ab_headers(self, mock_pipeline):
+        mock_pipeline.return_value = PipelineResponse(
+            response="Hi",
+            model_used="moonshot-v1-32k",
+            tier="t2_medium",
+            ab_test="t1-vs-t2",
+            ab_variant="t2",
+        )
+
+        response = self.client.post("/generate", json={"user_message": "Hi"})
+
+        assert response.headers["x-ab-test"] == "t1-vs-t2"
+        assert response.headers["x-ab-variant"] == "t2"
+
+    @patch("main.run_pipeline")
+    def test_generate_without_test_has_no_headers(self, mock_pipeline):
+        mock_pipeline.return_value = PipelineResponse(response="Hi", model_used="m")
+
+        response = self.client.post("/generate", json={"user_message": "Hi"})
+
+        assert "x-ab-variant" not in response.headers
+
+    @patch("main.stream_pipeline")
+    def test_generate_stream_sets_ab_headers(self, mock_stream):
+        async def chunks():
+            yield "Hi"
+
+        mock_stream.return_value = PipelineStream(
+            chunks=chunks(),
+            model_used="moonshot-v1-32k",
+            tier="t2_medium",
+            ab_test="t1-vs-t2",
+            ab_variant="t2",
+        )
+
+        response = self.client.post("/generate/stream", json={"user_message": "Hi"})
+
+        assert response.headers["x-ab-test"] == "t1-vs-t2"
+        assert response.headers["x-ab-variant"] == "t2"
+
+    def test_ab_results_endpoint(self, ab_config):
+        with patch("ab_test.AB_TEST", ab_config):
+            response = self.client.get("/ab-results")
+
+        assert response.status_code == 200
+        assert response.json()["test_id"] == "t1-vs-t2"
@@ -30,6 +30,40 @@ class TestHealthEndpoint:
         assert response.json()["service"] == "velox-llm-agents"
 
 
+class TestMetricsEndpoint:
+    """Tests for GET /metrics."""
+
+    def test_metrics_single_process(self, monkeypatch):
+        monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+
+    def test_metrics_multiprocess_dir(self, monkeypatch, tmp_path):
+        from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+        # Simulate a gunicorn worker (pid 4242) that counted 3 cache misses
+        worker_file = MmapedDict(str(tmp_path / "counter_4242.db"))
+        worker_file.write_value(
+            mmap_key(
+                "response_cache_misses",
+                "response_cache_misses_total",
+                [],
+                [],
+                "Number of pipeline requests that missed the response cache",
+            ),
+            3.0,
+            0.0,
+        )
+        worker_file.close()
+
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "response_cache_misses_total 3.0" in response.text
+
+
 class TestGenerateEndpoint:
     """Tests for POST /generate endpoint."""
 
@@ -103,6 +137,60 @@ class TestGenerateEndpoint:
             assert response.status_code == 200
 
 
+class TestGenerateStreamEndpoint:
+    """Tests for POST /generate/stream endpoint."""
+
+    def test_stream_rejects_empty_message(self):
+        response = client.post("/generate/stream", json={"user_message": "  "})
+        assert response.status_code == 400
+
+    @patch("main.stream_pipeline")
+    def test_stream_emits_tokens_then_done(self, mock_stream):
+        from pipeline import PipelineStream
+
+        async def chunks():
+            yield "Hello"
+            yield " there"
+
+        mock_stream.return_value = PipelineStream(
+            chunks=chunks(),
+            model_used="moonshot-v1-8k",
+            tier="t1_fast",
+        )
+
+        response = client.post("/generate/stream", json={"user_message": "Hi"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["x-model-used"] == "moonshot-v1-8k"
+        assert response.text == (
+            'data: {"token":"Hello"}\n\n'
+            'data: {"token":" there"}\n\n'
+            "data: [DONE]\n\n"
+        )
+
+    @patch("main.stream_pipeline")
+    def test_stream_failure_emits_error_instead_of_done(self, mock_stream):
+        from pipeline import PipelineStream, StreamInterrupted
+
+        async def chunks():
+            yield "Hello"
+            raise StreamInterrupted("connection reset")
+
+        mock_stream.return_value = PipelineStream(
+            chunks=chunks(),
+            model_used="moonshot-v1-8k",
+            tier="t1_fast",
+        )
+
+        response = client.post("/generate/stream", json={"user_message": "Hi"})
+
+        assert response.text == (
+            'data: {"token":"Hello"}\n\n'
+            'event: error\ndata: {"error":"stream interrupted"}\n\n'
+        )
+
+
 class TestRequestValidation:
     """Tests for request validation."""
 
@@ -6,20 +6,33 @@ Tests:
   - Tier-based model selection (T1/T2/T3)
   - Word count fallback routing
   - System prompt building
+  - Streaming: SSE parsing and stream_pipeline error handling
 """
 
+import httpx
+import orjson
 import pytest
 from unittest.mock import patch, AsyncMock
 
 from pipeline import (
     PipelineRequest,
     PipelineResponse,
+    StreamInterrupted,
     run_pipeline,
+    stream_pipeline,
     _build_system_prompt,
+    _chat_body,
+    _stream_openai_compatible,
     T1_MAX_WORDS,
     T2_MAX_WORDS,
 )
-from router import ModelTier, route_request, route_by_word_count, RoutingResult
+from router import (
+    ModelTier,
+    RoutingResult,
+    count_words_capped,
+    route_by_word_count,
+    route_request,
+)
 
 
 class TestSemanticRouter:
@@ -94,6 +107,24 @@ class TestWordCountRouting:
         assert tier == ModelTier.T3_HEAVY
 
 
+class TestCountWordsCapped:
+    """Tests for the capped word counter used by fallback routing."""
+
+    def test_counts_short_message(self):
+        assert count_words_capped("  hello   there\tfriend\n") == 3
+
+    def test_empty_message(self):
+        assert count_words_capped("") == 0
+        assert count_words_capped("   ") == 0
+
+    def test_stops_at_cap(self):
+        assert count_words_capped(" ".join(["word"] * 500), cap=T2_MAX_WORDS) == T2_MAX_WORDS
+
+    def test_capped_count_routes_like_full_count(self):
+        message = " ".join(["word"] * 500)
+        assert route_by_word_count(count_words_capped(message)) == ModelTier.T3_HEAVY
+
+
 class TestPipelineRouting:
     """Tests for end-to-end pipeline routing."""
 
@@ -163,6 +194,140 @@ class TestPipelineRouting:
         mock_call.assert_called_once()
 
 
+def _sse(*events: str) -> bytes:
+    return "".join(f"{event}\n\n" for event in events).encode()
+
+
+async def _collect_stream(handler) -> list[str]:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("pipeline.get_http_client", return_value=client):
+        return [
+            delta async for delta in _stream_openai_compatible(
+                "Hi", "", "moonshot-v1-8k", "key", "https://llm.test/v1"
+            )
+        ]
+
+
+class TestStreamParsing:
+    """Tests for the OpenAI-style SSE parser in _stream_openai_compatible."""
+
+    @pytest.mark.asyncio
+    async def test_yields_content_deltas_and_skips_role_only_delta(self):
+        def handler(request):
+            assert orjson.loads(request.content)["stream"] is True
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse(
+                'data: {"choices":[{"delta":{"role":"assistant"}}]}',
+                'data: {"choices":[{"delta":{"content":"Hello"}}]}',
+                'data: {"choices":[{"delta":{"content":" there"}}]}',
+                "data: [DONE]",
+            ))
+
+        assert await _collect_stream(handler) == ["Hello", " there"]
+
+    @pytest.mark.asyncio
+    async def test_ignores_comment_and_keepalive_lines(self):
+        def handler(request):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse(
+                ": keep-alive",
+                'data: {"choices":[{"delta":{"content":"Hi"}}]}',
+                ":",
+                "data: [DONE]",
+            ))
+
+        assert await _collect_stream(handler) == ["Hi"]
+
+    @pytest.mark.asyncio
+    async def test_stops_at_done(self):
+        def handler(request):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse(
+                'data: {"choices":[{"delta":{"content":"Hi"}}]}',
+                "data: [DONE]",
+                'data: {"choices":[{"delta":{"content":"ignored"}}]}',
+            ))
+
+        assert await _collect_stream(handler) == ["Hi"]
+
+    @pytest.mark.asyncio
+    async def test_skips_events_with_empty_choices(self):
+        def handler(request):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse(
+                'data: {"choices":[{"delta":{"content":"Hi"}}]}',
+                'data: {"choices":[],"usage":{"prompt_tokens":12}}',
+                "data: [DONE]",
+            ))
+
+        assert await _collect_stream(handler) == ["Hi"]
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_json_body(self):
+        def handler(request):
+            return httpx.Response(200, json={
+                "choices": [{"message": {"role": "assistant", "content": "Whole reply"}}],
+            })
+
+        assert await _collect_stream(handler) == ["Whole reply"]
+
+    @pytest.mark.asyncio
+    async def test_http_error_status_raises(self):
+        def handler(request):
+            return httpx.Response(503, json={"error": "overloaded"})
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await _collect_stream(handler)
+
+
+class TestStreamPipelineErrors:
+    """Tests for stream_pipeline's handling of provider failures."""
+
+    @pytest.fixture(autouse=True)
+    def routed_to_kimi(self):
+        result = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        with patch("pipeline.route_request", AsyncMock(return_value=result)), \
+                patch("pipeline.LLM_PROVIDER", "kimi"), \
+                patch("pipeline.RESPONSE_CACHE_ENABLED", True):
+            yield
+
+    @pytest.mark.asyncio
+    @patch("pipeline._stream_openai_compatible")
+    async def test_stream_error_before_first_token_yields_fallback(self, mock_stream):
+        async def failing(*args, **kwargs):
+            raise RuntimeError("upstream down")
+            yield  # pragma: no cover
+
+        mock_stream.side_effect = failing
+
+        stream = await stream_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+        chunks = [chunk async for chunk in stream.chunks]
+
+        assert len(chunks) == 1
+        assert "trouble" in chunks[0].lower()
+
+    @pytest.mark.asyncio
+    @patch("pipeline._stream_openai_compatible")
+    async def test_stream_error_mid_reply_raises_and_is_not_cached(self, mock_stream):
+        from response_cache import response_cache
+
+        async def truncated(*args, **kwargs):
+            yield "Hello"
+            raise RuntimeError("connection reset")
+
+        mock_stream.side_effect = truncated
+
+        stream = await stream_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+        chunks = []
+        with pytest.raises(StreamInterrupted):
+            async for chunk in stream.chunks:
+                chunks.append(chunk)
+
+        assert chunks == ["Hello"]
+        assert response_cache.stats()["entries"] == 0
+
+
 class TestSystemPrompt:
     """Tests for system prompt building."""
 
@@ -182,6 +347,16 @@ class TestSystemPrompt:
         prompt = _build_system_prompt("")
         assert "markdown" in prompt.lower()
 
+    def test_same_context_returns_same_object(self):
+        context = "Business hours are 9-5"
+        assert _build_system_prompt(context) is _build_system_prompt(context)
+
+    def test_chat_body_uses_built_prompt(self):
+        context = "Business hours are 9-5"
+        body = orjson.loads(_chat_body("Hi", context, "moonshot-v1-8k"))
+        assert body["messages"][0]["content"] == _build_system_prompt(context)
+        assert body["messages"][1] == {"role": "user", "content": "Hi"}
+
 
 class TestRoutingThresholds:
     """Tests for routing threshold constants."""
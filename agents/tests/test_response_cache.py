@@ -0,0 +1,163 @@
+"""
+test_response_cache.py — Unit tests for the pipeline response cache.
+
+Tests:
+  - Exact-tier hits, normalization and tenant scoping
+  - LRU eviction and TTL expiry
+  - run_pipeline / stream_pipeline short-circuit on cache hit
+"""
+
+import pytest
+from unittest.mock import patch
+
+from pipeline import PipelineRequest, run_pipeline, stream_pipeline
+from response_cache import ResponseCache, make_cache_key
+from router import ModelTier, RoutingResult
+
+
+class TestCacheKey:
+    """Tests for cache key construction."""
+
+    def test_normalizes_case_and_whitespace(self):
+        assert make_cache_key("a1", "  Hello   There ", "") == make_cache_key("a1", "hello there", "")
+
+    def test_scoped_by_agent(self):
+        assert make_cache_key("a1", "hello", "") != make_cache_key("a2", "hello", "")
+
+    def test_scoped_by_context(self):
+        assert make_cache_key("a1", "hello", "kb-1") != make_cache_key("a1", "hello", "kb-2")
+
+
+class TestExactTier:
+    """Tests for the exact-match LRU tier."""
+
+    @pytest.mark.asyncio
+    async def test_miss_then_hit(self):
+        cache = ResponseCache(enable_semantic=False)
+
+        assert await cache.get("a1", "Hello", "") is None
+        await cache.put("a1", "Hello", "", "Hi there!", "moonshot-v1-8k", "t1_fast")
+        cached = await cache.get("a1", "hello", "")
+
+        assert cached.response == "Hi there!"
+        assert cached.cache_tier == "exact"
+        assert cache.stats()["hits"]["exact"] == 1
+        assert cache.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_does_not_leak_across_agents(self):
+        cache = ResponseCache(enable_semantic=False)
+        await cache.put("a1", "Hello", "", "Hi from a1", "m", "t1_fast")
+
+        assert await cache.get("a2", "Hello", "") is None
+
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used(self):
+        cache = ResponseCache(max_entries=2, enable_semantic=False)
+        await cache.put("a1", "one", "", "1", "m")
+        await cache.put("a1", "two", "", "2", "m")
+        await cache.get("a1", "one", "")  # "two" is now LRU
+        await cache.put("a1", "three", "", "3", "m")
+
+        assert await cache.get("a1", "two", "") is None
+        assert (await cache.get("a1", "one", "")).response == "1"
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_miss(self):
+        cache = ResponseCache(ttl_s=0, enable_semantic=False)
+        await cache.put("a1", "Hello", "", "Hi", "m")
+
+        assert await cache.get("a1", "Hello", "") is None
+
+
+class TestPipelineCache:
+    """Tests for the cache in front of run_pipeline."""
+
+    @pytest.fixture(autouse=True)
+    def enable_cache(self):
+        with patch("pipeline.RESPONSE_CACHE_ENABLED", True):
+            yield
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._call_openai_compatible")
+    async def test_requests_without_agent_id_are_not_cached(self, mock_call, mock_route):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        mock_call.return_value = "Hello from Kimi!"
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"):
+            await run_pipeline(PipelineRequest(user_message="Hi"))
+            await run_pipeline(PipelineRequest(user_message="Hi"))
+
+        assert mock_call.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._call_openai_compatible")
+    async def test_second_identical_request_skips_llm(self, mock_call, mock_route):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        mock_call.return_value = "Hello from Kimi!"
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"):
+            first = await run_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+            second = await run_pipeline(PipelineRequest(user_message="hi ", agent_id="a1"))
+
+        assert second.response == first.response
+        assert second.model_used == first.model_used
+        mock_call.assert_called_once()
+        mock_route.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._call_openai_compatible")
+    async def test_errors_are_not_cached(self, mock_call, mock_route):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+        mock_call.side_effect = RuntimeError("upstream down")
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"):
+            await run_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+            await run_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+
+        assert mock_call.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("pipeline.route_request")
+    @patch("pipeline._stream_openai_compatible")
+    async def test_streamed_response_is_cached(self, mock_stream, mock_route):
+        mock_route.return_value = RoutingResult(
+            tier=ModelTier.T1_FAST,
+            intent="greeting",
+            confidence=0.9,
+            latency_ms=10.0,
+        )
+
+        async def deltas(*args, **kwargs):
+            yield "Hello"
+            yield " from Kimi!"
+
+        mock_stream.side_effect = deltas
+
+        with patch("pipeline.LLM_PROVIDER", "kimi"):
+            first = await stream_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+            streamed = [chunk async for chunk in first.chunks]
+            second = await run_pipeline(PipelineRequest(user_message="Hi", agent_id="a1"))
+
+        assert streamed == ["Hello", " from Kimi!"]
+        assert second.response == "Hello from Kimi!"
+        assert second.model_used == first.model_used
+        mock_route.assert_called_once()
@@ -179,11 +179,34 @@ async def test_generate_with_rag(mock_llm_call, sample_state):
     assert "9 AM" in result["response"]
     assert result["total_latency_ms"] > 0
 
-    # Verify system prompt included RAG context
+    # Verify RAG context rides in the final user turn, after the static persona
     call_args = mock_llm_call.call_args
     messages = call_args.kwargs.get("messages", call_args.args[0] if call_args.args else [])
-    system_msg = messages[0]["content"]
-    assert "KNOWLEDGE BASE" in system_msg
+    assert messages[0] == {"role": "system", "content": "You are a helpful assistant."}
+    assert [m["role"] for m in messages].count("system") == 1
+    assert messages[-1]["role"] == "user"
+    assert "KNOWLEDGE BASE" in messages[-1]["content"]
+    assert messages[-1]["content"].endswith("Question: Hello")
+
+
+def test_build_messages_order():
+    """Persona first, then history, then one user turn carrying the context."""
+    from voice_agent import _build_messages
+
+    history = [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello! How can I help?"},
+    ]
+
+    messages = _build_messages("Persona", history, "When do you open?", "Hours: 9-5")
+
+    assert messages == [
+        {"role": "system", "content": "Persona"},
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello! How can I help?"},
+        {"role": "user", "content": "Context:\nHours: 9-5\n\nQuestion: When do you open?"},
+    ]
+    assert _build_messages("Persona", history, "Bye")[-1] == {"role": "user", "content": "Bye"}
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,26 @@
+"""
+test_warmup_prompts.py — Keep the SGLang prefix-cache warmup in sync.
+
+deploy/modal/config.py cannot import agents/ inside the Modal image, so it
+carries its own copy of the static system prompts. If the copies drift the
+warmup primes a prefix real traffic never sends; these tests catch that.
+"""
+
+import importlib.util
+from pathlib import Path
+
+from pipeline import _BASE
+from voice_agent import VOICE_SYSTEM_PROMPT
+
+MODAL_CONFIG = Path(__file__).resolve().parents[2] / "deploy" / "modal" / "config.py"
+
+
+def _load_modal_config():
+    spec = importlib.util.spec_from_file_location("modal_config", MODAL_CONFIG)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_warmup_prompts_match_agent_prompts():
+    assert _load_modal_config().WARMUP_SYSTEM_PROMPTS == [_BASE, VOICE_SYSTEM_PROMPT]
@@ -20,10 +20,12 @@ from __future__ import annotations
 import logging
 import os
 import time
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Any, Callable, Optional
 
-import httpx
+import orjson
+
+from http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -83,11 +85,13 @@ def get_langsmith_client():
     return _langsmith_client
 
 
+@lru_cache(maxsize=1)
 def get_langsmith_callback():
     """
     Get a LangSmith callback handler for LangGraph.
 
-    Returns None if LangSmith is not configured.
+    The handler is stateless, so one instance is built and shared across
+    requests. Returns None if LangSmith is not configured.
     """
     if not LANGSMITH_ENABLED:
         return None
@@ -198,23 +202,24 @@ async def traced_llm_call(
 
     # Make the API call
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(
-                f"{base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                },
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            response_text = data["choices"][0]["message"]["content"]
+        client = get_http_client()
+        resp = await client.post(
+            f"{base_url}/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            content=orjson.dumps({
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            }),
+        )
+        resp.raise_for_status()
+        data = orjson.loads(resp.content)
+        response_text = data["choices"][0]["message"]["content"]
+        usage = data.get("usage") or {}
 
     except Exception as e:
         logger.error("LLM call failed: provider=%s model=%s error=%s", provider, model, e)
@@ -243,16 +248,30 @@ async def traced_llm_call(
     )
 
     logger.debug(
-        "LLM call completed: provider=%s model=%s tier=%s latency=%.1fms",
+        "LLM call completed: provider=%s model=%s tier=%s latency=%.1fms "
+        "prompt_tokens=%d cached_tokens=%d",
         provider,
         model,
         tier,
         latency_ms,
+        usage.get("prompt_tokens") or 0,
+        cached_prompt_tokens(usage),
     )
 
     return response_text
 
 
+def cached_prompt_tokens(usage: dict) -> int:
+    """
+    Prompt tokens served from the provider's prefix cache.
+
+    OpenAI/SGLang report usage.prompt_tokens_details.cached_tokens; Moonshot
+    reports usage.cached_tokens. Returns 0 when the provider reports neither.
+    """
+    details = usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or usage.get("cached_tokens") or 0)
+
+
 def _log_llm_trace(
     messages: list[dict],
     response: str,
@@ -158,6 +158,34 @@ INTENT_TO_PATH: dict[str, str] = {
 }
 
 
+# ─── Prompt Layout ────────────────────────────────────────────────────────────
+
+
+def _build_messages(
+    system_prompt: str,
+    conversation_history: list[dict],
+    user_message: str,
+    turn_context: str = "",
+) -> list[dict]:
+    """
+    Lay out chat messages from most to least stable.
+
+      [system: persona] → [history] → [user: per-turn context + question]
+
+    The persona and the append-only history form a prefix that repeats across
+    turns, so provider prompt caches can reuse it. Retrieved KB chunks and
+    tool results change every turn, so they ride in the final user turn
+    rather than in the prefix. The system message stays first and single:
+    several chat templates reject or drop a system message anywhere else.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(conversation_history[-10:])  # Last 10 turns
+    if turn_context:
+        user_message = f"Context:\n{turn_context}\n\nQuestion: {user_message}"
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
 # ─── Node Functions ───────────────────────────────────────────────────────────
 
 
@@ -224,10 +252,7 @@ async def generate_response(state: VoiceAgentState) -> VoiceAgentState:
     # Build system prompt
     system_prompt = agent_config.get("system_prompt", VOICE_SYSTEM_PROMPT)
 
-    # Build messages
-    messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(conversation_history[-10:])  # Last 10 turns
-    messages.append({"role": "user", "content": user_message})
+    messages = _build_messages(system_prompt, conversation_history, user_message)
 
     # Select model based on tier
     tier = ModelTier.T1_FAST
@@ -376,23 +401,18 @@ async def generate_with_rag(state: VoiceAgentState) -> VoiceAgentState:
     agent_config = state.get("agent_config", {})
     rag_context = state.get("rag_context", "")
 
-    # Build system prompt with RAG context
+    # Per-turn RAG context rides in the user turn, not in the system prefix
     base_prompt = agent_config.get("system_prompt", VOICE_SYSTEM_PROMPT)
+    turn_context = ""
     if rag_context:
-        system_prompt = (
-            f"{base_prompt}\n\n"
+        turn_context = (
             f"=== KNOWLEDGE BASE ===\n{rag_context}\n"
             f"======================\n\n"
             "Use the knowledge base to answer the user's question accurately. "
             "If the answer is not in the knowledge base, say you don't have that information."
         )
-    else:
-        system_prompt = base_prompt
 
-    # Build messages
-    messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(conversation_history[-10:])
-    messages.append({"role": "user", "content": user_message})
+    messages = _build_messages(base_prompt, conversation_history, user_message, turn_context)
 
     # Select model - T2 for RAG responses
     tier = ModelTier.T2_MEDIUM
@@ -513,26 +533,21 @@ async def generate_with_tool(state: VoiceAgentState) -> VoiceAgentState:
     agent_config = state.get("agent_config", {})
     tool_results = state.get("tool_results", [])
 
-    # Build system prompt with tool results
+    # Per-turn tool results ride in the user turn, not in the system prefix
     base_prompt = agent_config.get("system_prompt", VOICE_SYSTEM_PROMPT)
+    turn_context = ""
     if tool_results:
         tool_context = "\n".join(
             f"- {r.get('tool')}: {r.get('result')}"
             for r in tool_results
         )
-        system_prompt = (
-            f"{base_prompt}\n\n"
+        turn_context = (
             f"=== TOOL RESULTS ===\n{tool_context}\n"
             f"====================\n\n"
             "Use the tool results to answer the user's question."
         )
-    else:
-        system_prompt = base_prompt
 
-    # Build messages
-    messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(conversation_history[-10:])
-    messages.append({"role": "user", "content": user_message})
+    messages = _build_messages(base_prompt, conversation_history, user_message, turn_context)
 
     # Select model
     tier = ModelTier.T2_MEDIUM
@@ -577,24 +592,20 @@ async def multi_step_reasoning(state: VoiceAgentState) -> VoiceAgentState:
     agent_config = state.get("agent_config", {})
     rag_context = state.get("rag_context", "")
 
-    # Build enhanced system prompt for complex reasoning
+    # Reasoning instructions + RAG context are per-turn; keep the persona prefix shared
     base_prompt = agent_config.get("system_prompt", VOICE_SYSTEM_PROMPT)
-    system_prompt = (
-        f"{base_prompt}\n\n"
+    turn_context = (
         "For this complex question, think through your answer step by step, "
         "but provide a concise spoken response at the end."
     )
 
     if rag_context:
-        system_prompt += (
+        turn_context += (
             f"\n\n=== KNOWLEDGE BASE ===\n{rag_context}\n"
             f"======================\n"
         )
 
-    # Build messages
-    messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(conversation_history[-10:])
-    messages.append({"role": "user", "content": user_message})
+    messages = _build_messages(base_prompt, conversation_history, user_message, turn_context)
 
     # Use T3 Heavy tier for complex reasoning
     tier = ModelTier.T3_HEAVY
@@ -73,16 +73,57 @@ SGLANG_CONFIG = {
     # Maximum concurrent sequences
     "max_batch_size": int(os.getenv("SGLANG_MAX_BATCH_SIZE", "32")),
 
+    # Dynamic micro-batching: requests queued behind busy slots are sent as
+    # one run_batch call of up to this size; max_batch_size // micro_batch_size
+    # batches run concurrently so every runtime sequence slot stays fed
+    "micro_batch_size": int(os.getenv("SGLANG_MICRO_BATCH_SIZE", "8")),
+
     # Enable prefix caching (critical for <200ms TTFT)
     "enable_prefix_caching": True,
 
+    # Longest-prefix-match scheduling keeps requests that share the static
+    # system block together so RadixAttention reuses its KV cache
+    "schedule_policy": os.getenv("SGLANG_SCHEDULE_POLICY", "lpm"),
+
     # Memory management
     "mem_fraction_static": float(os.getenv("SGLANG_MEM_FRACTION", "0.85")),
 
+    # Fused attention kernels (flashinfer ships in the image; "triton" is the fallback)
+    "attention_backend": os.getenv("SGLANG_ATTENTION_BACKEND", "flashinfer"),
+
+    # Hardware — same image runs on any Modal GPU type
+    "gpu": os.getenv("SGLANG_GPU", "A100-40GB"),
+
+    # Containers kept resident with weights loaded. Default 0 scales to zero
+    # when idle; set SGLANG_KEEP_WARM=1 (or more) at deploy time to avoid cold
+    # starts at the cost of a GPU billed around the clock per warm container
+    "keep_warm": int(os.getenv("SGLANG_KEEP_WARM", "0")),
+
     # Tensor parallelism (for large models like Qwen 32B)
     "tensor_parallel_size": int(os.getenv("SGLANG_TP_SIZE", "1")),
 }
 
+# ─── Prefix Cache Warmup ──────────────────────────────────────────────────────
+# Static system blocks sent by agents/ on nearly every turn. Prefilled once at
+# container start so the first real call only prefills the user turn.
+# Must equal agents/pipeline.py _BASE and agents/voice_agent.py
+# VOICE_SYSTEM_PROMPT (the Modal image cannot import agents/) — enforced by
+# agents/tests/test_warmup_prompts.py.
+
+WARMUP_SYSTEM_PROMPTS = [
+    (
+        "You are Velox, a professional voice AI assistant. "
+        "Keep answers concise — under two sentences. "
+        "Do not use markdown formatting; your reply will be spoken aloud."
+    ),
+    (
+        "You are Velox, a professional voice AI assistant. "
+        "Keep answers concise — under two sentences. "
+        "Do not use markdown formatting; your reply will be spoken aloud. "
+        "If you don't know something, say so honestly rather than guessing."
+    ),
+]
+
 # ─── Latency Targets (for monitoring) ─────────────────────────────────────────
 
 LATENCY_TARGETS_MS = {
@@ -17,12 +17,13 @@ Usage:
 
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Optional
+from typing import Any, Callable, Optional
 
 import modal
 
-from config import MODELS, SGLANG_CONFIG
+from config import MODELS, SGLANG_CONFIG, WARMUP_SYSTEM_PROMPTS
 
 # ─── Modal App Definition ─────────────────────────────────────────────────────
 
@@ -47,6 +48,9 @@ sglang_image = (
         # Pre-download models on image build for faster cold starts
         "python -c \"from transformers import AutoTokenizer; AutoTokenizer.from_pretrained('Qwen/Qwen2.5-3B-Instruct')\"",
     )
+    # Cache model weights on the persistent volume so cold starts read them
+    # locally instead of re-downloading from the Hub
+    .env({"HF_HOME": "/models/hf"})
 )
 
 # ─── Volume for Model Weights ─────────────────────────────────────────────────
@@ -60,16 +64,84 @@ MODEL_DIR = "/models"
 sglang_secret = modal.Secret.from_name("velox-sglang-secret", required_keys=[])
 
 
+# ─── Dynamic Micro-Batching ───────────────────────────────────────────────────
+
+
+class DynBatcher:
+    """
+    Coalesces queued requests into batched inference calls.
+
+    Up to `max_in_flight` batches run concurrently, so the SGLang runtime's
+    continuous batching always has work. A request that arrives while a slot
+    is free is dispatched immediately; requests that queue up while every
+    slot is busy are drained together (up to `max_batch_size`) into the next
+    batch. `infer_fn` is blocking and runs on a worker thread.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[list[Any]], list[Any]],
+        max_batch_size: int = 8,
+        max_in_flight: int = 4,
+    ):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self._worker: Optional[asyncio.Task] = None
+
+    async def process_batched(self, item: Any) -> Any:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            await self._slots.acquire()
+
+            # Everything that queued while waiting for a slot joins this batch
+            batch = [first]
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: list[tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await asyncio.to_thread(self.infer_fn, [item for item, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+
 # ─── SGLang Server Class ──────────────────────────────────────────────────────
 
 
 @app.cls(
     image=sglang_image,
-    gpu=modal.gpu.A100(count=1, memory=40),  # A100-40GB for T1/T2
+    gpu=SGLANG_CONFIG["gpu"],  # A100-40GB for T1/T2 by default
     volumes={MODEL_DIR: model_volume},
     secrets=[sglang_secret],
     container_idle_timeout=300,  # 5 min idle before scale down
-    allow_concurrent_inputs=100,  # High concurrency for voice
+    keep_warm=SGLANG_CONFIG["keep_warm"],  # Opt-in resident containers (SGLANG_KEEP_WARM)
+    enable_memory_snapshot=True,  # Restore loaded CPU state instead of re-importing
+    # One input per engine slot — extra load scales out to new containers
+    # instead of queueing behind a saturated runtime.
+    allow_concurrent_inputs=SGLANG_CONFIG["max_batch_size"],
     timeout=600,  # 10 min max request timeout
 )
 class SGLangServer:
@@ -82,6 +154,8 @@ class SGLangServer:
     def __init__(self):
         self.engines: dict = {}
         self.current_model: Optional[str] = None
+        self._chat_completion = None
+        self._batcher: Optional[DynBatcher] = None
 
     @modal.enter()
     def start_engines(self):
@@ -101,12 +175,50 @@ class SGLangServer:
                 context_length=SGLANG_CONFIG["context_length"],
                 max_num_seqs=SGLANG_CONFIG["max_batch_size"],
                 enable_prefix_caching=True,  # Critical for <200ms TTFT
+                schedule_policy=SGLANG_CONFIG["schedule_policy"],
+                mem_fraction_static=SGLANG_CONFIG["mem_fraction_static"],
+                attention_backend=SGLANG_CONFIG["attention_backend"],
             )
         )
 
+        @sgl.function
+        def chat_completion(s, system_content, user_content, max_tokens, temperature):
+            if system_content:
+                s += sgl.system(system_content)
+            s += sgl.user(user_content)
+            s += sgl.assistant(sgl.gen("response", max_tokens=max_tokens, temperature=temperature))
+
+        self._chat_completion = chat_completion
         self.current_model = t1_model
         print(f"SGLang runtime started with {t1_model}")
 
+        self._warm_prefix_cache()
+
+    def _warm_prefix_cache(self):
+        """
+        Prefill the static system blocks into the RadixAttention tree.
+
+        Later requests sharing these prefixes only prefill the user turn.
+        """
+        try:
+            self._chat_completion.run_batch([
+                {
+                    "system_content": system_prompt,
+                    "user_content": "Hello",
+                    "max_tokens": 1,
+                    "temperature": 0.0,
+                }
+                for system_prompt in WARMUP_SYSTEM_PROMPTS
+            ])
+            print(f"Prefix cache warmed with {len(WARMUP_SYSTEM_PROMPTS)} system prompts")
+        except Exception as e:
+            print(f"Prefix cache warmup failed (continuing cold): {e}")
+
+    def _infer_batch(self, batch: list[dict]) -> list[str]:
+        """Run one batched SGLang generation (blocking)."""
+        states = self._chat_completion.run_batch(batch)
+        return [state["response"] for state in states]
+
     @modal.method()
     async def generate(
         self,
@@ -119,6 +231,10 @@ class SGLangServer:
         """
         Generate completion using SGLang.
 
+        Calls are dispatched through a DynBatcher: idle-time requests go
+        straight to the runtime, and requests that queue behind busy slots
+        are coalesced into one `run_batch` call.
+
         Args:
             model: Model identifier (maps to T0/T1/T2)
             messages: OpenAI-format messages
@@ -129,7 +245,6 @@ class SGLangServer:
         Returns:
             OpenAI-compatible completion response
         """
-        import sglang as sgl
         import time
 
         start_time = time.perf_counter()
@@ -143,27 +258,35 @@ class SGLangServer:
 
         tier = model_map.get(model, "fast")
 
-        # Build prompt from messages
-        system_content = ""
+        # Build prompt from messages. Callers may send the static persona and
+        # per-turn context as separate system messages — keep both, in order.
+        system_parts: list[str] = []
         user_content = ""
 
         for msg in messages:
             if msg["role"] == "system":
-                system_content = msg["content"]
+                system_parts.append(msg["content"])
             elif msg["role"] == "user":
                 user_content = msg["content"]
 
-        # SGLang generation
-        @sgl.function
-        def chat_completion(s):
-            if system_content:
-                s += sgl.system(system_content)
-            s += sgl.user(user_content)
-            s += sgl.assistant(sgl.gen("response", max_tokens=max_tokens, temperature=temperature))
+        system_content = "\n\n".join(system_parts)
+
+        # Batched SGLang generation (created lazily on the container's loop)
+        if self._batcher is None:
+            self._batcher = DynBatcher(
+                self._infer_batch,
+                max_batch_size=SGLANG_CONFIG["micro_batch_size"],
+                max_in_flight=max(
+                    1, SGLANG_CONFIG["max_batch_size"] // SGLANG_CONFIG["micro_batch_size"]
+                ),
+            )
 
-        # Run generation
-        state = chat_completion.run()
-        response_text = state["response"]
+        response_text = await self._batcher.process_batched({
+            "system_content": system_content,
+            "user_content": user_content,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        })
 
         # Calculate metrics
         ttft_ms = (time.perf_counter() - start_time) * 1000
@@ -237,7 +360,7 @@ async def chat_completions(request: dict) -> dict:
     """
     server = SGLangServer()
 
-    return await server.generate.remote(
+    return await server.generate.remote.aio(
         model=request.get("model", MODELS["sglang"]["fast"]),
         messages=request.get("messages", []),
         temperature=request.get("temperature", 0.7),
@@ -251,7 +374,7 @@ async def chat_completions(request: dict) -> dict:
 async def health() -> dict:
     """Health check endpoint."""
     server = SGLangServer()
-    return server.health.remote()
+    return await server.health.remote.aio()
 
 
 @app.function(image=sglang_image)
@@ -18,19 +18,24 @@
 #   --since       Only export conversations started after this date (YYYY-MM-DD)
 
 import argparse
-import json
 import os
 import sys
 from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 
 try:
+    import orjson
     import psycopg2
     import psycopg2.extras
 except ImportError:
-    print("ERROR: psycopg2 not installed. Run: pip install psycopg2-binary")
+    print("ERROR: dependencies not installed. Run: pip install psycopg2-binary orjson")
     sys.exit(1)
 
+# Rows fetched per round-trip by the server-side cursor
+STREAM_BATCH_ROWS = 500
+
 # ─── Prompt template ──────────────────────────────────────────────────────────
 
 SYSTEM_PROMPT = (
@@ -39,19 +44,22 @@ SYSTEM_PROMPT = (
     "Do not use markdown, bullet points, or formatting."
 )
 
+# Constant pieces of the ChatML template, built once
+_HEADER = f"<|system|>\n{SYSTEM_PROMPT}"
+_FOOTER = "<|end|>"
+_PFX = {"user": "<|user|>\n", "assistant": "<|assistant|>\n"}
+
+# Output buffer for the JSONL writer
+WRITE_BUFFER_BYTES = 1 << 20
+
 def format_conversation(messages: list[dict]) -> str:
     """Format a list of {role, content} dicts into ChatML format for SFT."""
-    parts = [f"<|system|>\n{SYSTEM_PROMPT}"]
-    for msg in messages:
-        role = msg["role"]
-        content = msg["content"].strip()
-        if role == "user":
-            parts.append(f"<|user|>\n{content}")
-        elif role == "assistant":
-            parts.append(f"<|assistant|>\n{content}")
-        # Skip 'tool' messages — not needed for base SFT
-    parts.append("<|end|>")
-    return "\n".join(parts)
+    # Skip 'tool' messages — not needed for base SFT
+    return "\n".join([
+        _HEADER,
+        *(f"{_PFX[m['role']]}{m['content'].strip()}" for m in messages if m["role"] in _PFX),
+        _FOOTER,
+    ])
 
 # ─── Main export logic ────────────────────────────────────────────────────────
 
@@ -62,11 +70,17 @@ def export(output: Path, min_turns: int, limit: int | None, since: str | None):
         sys.exit(1)
 
     conn = psycopg2.connect(db_url)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-    # Build query — only export COMPLETED conversations with enough turns
-    query = """
-        SELECT c.id AS conversation_id
+    # Named (server-side) cursor: rows stream from Postgres in batches of
+    # `itersize` as the loop consumes them, so memory stays flat no matter how
+    # many conversations are exported and the first write happens immediately.
+    cursor = conn.cursor(name="conv_stream", cursor_factory=psycopg2.extras.RealDictCursor)
+    cursor.itersize = STREAM_BATCH_ROWS
+
+    # Select COMPLETED conversations with enough turns, then pull all of their
+    # messages in one query (ordered so each conversation's rows are
+    # contiguous) instead of one SELECT per conversation.
+    conv_query = """
+        SELECT c.id, c.start_time
         FROM   conversations c
         WHERE  c.status = 'COMPLETED'
           AND  c.deleted_at IS NULL
@@ -75,46 +89,43 @@ def export(output: Path, min_turns: int, limit: int | None, since: str | None):
     params: dict = {"min_turns": min_turns}
 
     if since:
-        query += " AND c.start_time >= %(since)s"
+        conv_query += " AND c.start_time >= %(since)s"
         params["since"] = datetime.strptime(since, "%Y-%m-%d")
 
-    query += " ORDER BY c.start_time DESC"
+    conv_query += " ORDER BY c.start_time DESC"
 
     if limit:
-        query += " LIMIT %(limit)s"
+        conv_query += " LIMIT %(limit)s"
         params["limit"] = limit
 
+    query = f"""
+        WITH selected AS ({conv_query})
+        SELECT m.conversation_id, m.role, m.content
+        FROM   messages m
+        JOIN   selected s ON s.id = m.conversation_id
+        WHERE  m.role IN ('user', 'assistant')
+        ORDER  BY s.start_time DESC, m.conversation_id, m.created_at ASC
+    """
+
     cursor.execute(query, params)
-    conversations = cursor.fetchall()
-    print(f"Found {len(conversations)} qualifying conversations")
 
     output.parent.mkdir(parents=True, exist_ok=True)
+    found = 0
     exported = 0
 
-    with open(output, "w", encoding="utf-8") as f:
-        for row in conversations:
-            conv_id = row["conversation_id"]
-
-            # Fetch messages for this conversation in order
-            cursor.execute(
-                """
-                SELECT role, content
-                FROM   messages
-                WHERE  conversation_id = %s
-                  AND  role IN ('user', 'assistant')
-                ORDER  BY created_at ASC
-                """,
-                (conv_id,),
-            )
-            messages = cursor.fetchall()
+    with open(output, "wb", buffering=WRITE_BUFFER_BYTES) as f:
+        for _, rows in groupby(cursor, key=itemgetter("conversation_id")):
+            messages = list(rows)
+            found += 1
 
             if len(messages) < min_turns:
-                continue  # guard — double check
+                continue  # guard — tool/system messages counted in the filter
 
             text = format_conversation(messages)
-            f.write(json.dumps({"text": text}, ensure_ascii=False) + "\n")
+            f.write(orjson.dumps({"text": text}) + b"\n")
             exported += 1
 
+    print(f"Found {found} qualifying conversations")
     cursor.close()
     conn.close()
     print(f"Exported {exported} conversations to {output}")
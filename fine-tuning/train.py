@@ -4,9 +4,10 @@
 # 6.7 — LoRA/PEFT fine-tuning pipeline for Phi-3-mini and Mistral-7B.
 #
 # Uses:
-#   - HuggingFace PEFT  → LoRA adapters (r=16, alpha=32, target q_proj + v_proj)
-#   - bitsandbytes      → 8-bit quantisation (fits ~7B model in 16 GB VRAM)
-#   - TRL SFTTrainer    → SFT on ChatML-formatted JSONL
+#   - HuggingFace PEFT  → QLoRA adapters (r=16, alpha=32, all attention + MLP projections)
+#   - bitsandbytes      → 4-bit NF4 + double quantisation (~4 GB weights for a 7B model)
+#   - TRL SFTTrainer    → SFT on ChatML-formatted JSONL, with sample packing
+#   - FlashAttention-2  → fused attention kernel (falls back to SDPA if not installed)
 #   - MLflow            → tracks training loss, eval perplexity, hyperparams
 #
 # Usage:
@@ -22,13 +23,14 @@
 #     --output output/mistral-velox-v1
 
 import argparse
+import importlib.util
 import os
 from pathlib import Path
 
 import mlflow
 import torch
 from datasets import load_dataset
-from peft import LoraConfig, TaskType, get_peft_model
+from peft import LoraConfig, TaskType, get_peft_model, prepare_model_for_kbit_training
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
@@ -42,8 +44,8 @@ from trl import SFTTrainer
 LORA_CONFIG = LoraConfig(
     r=16,
     lora_alpha=32,
-    # Target the attention projection matrices — standard for most LLMs
-    target_modules=["q_proj", "v_proj"],
+    # Standard QLoRA recipe — adapt every attention and MLP projection
+    target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
     lora_dropout=0.05,
     bias="none",
     task_type=TaskType.CAUSAL_LM,
@@ -51,11 +53,15 @@ LORA_CONFIG = LoraConfig(
 
 # ─── Training hyperparameters ─────────────────────────────────────────────────
 
+# TF32 and FlashAttention-2 need compute capability 8.0+ (Ampere or newer).
+# is_bf16_supported() is not a substitute: it reports True on T4/V100 via emulation.
+AMPERE_OR_NEWER = torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8
+
 TRAINING_DEFAULTS = dict(
     num_train_epochs=3,
-    per_device_train_batch_size=4,
-    per_device_eval_batch_size=4,
-    gradient_accumulation_steps=4,  # effective batch = 16
+    per_device_train_batch_size=8,  # 4-bit weights leave room for 2x the batch
+    per_device_eval_batch_size=8,
+    gradient_accumulation_steps=2,  # effective batch = 16
     learning_rate=2e-4,
     lr_scheduler_type="cosine",
     warmup_ratio=0.05,
@@ -67,6 +73,20 @@ TRAINING_DEFAULTS = dict(
     load_best_model_at_end=True,
     metric_for_best_model="eval_loss",
     report_to="none",  # we handle MLflow manually below
+    # Memory/throughput
+    gradient_checkpointing=True,
+    gradient_checkpointing_kwargs={"use_reentrant": False},
+    optim="paged_adamw_8bit",
+    tf32=AMPERE_OR_NEWER,
+    dataloader_num_workers=4,
+    dataloader_pin_memory=True,
+)
+
+# FlashAttention-2 needs the flash-attn wheel and an Ampere+ GPU
+ATTN_IMPLEMENTATION = (
+    "flash_attention_2"
+    if importlib.util.find_spec("flash_attn") and AMPERE_OR_NEWER
+    else "sdpa"
 )
 
 # ─── Main ────────────────────────────────────────────────────────────────────
@@ -76,11 +96,14 @@ def train(model_name: str, dataset_path: str, output_dir: str):
     print(f"Model:   {model_name}")
     print(f"Dataset: {dataset_path}")
     print(f"Output:  {output_dir}")
+    print(f"Attn:    {ATTN_IMPLEMENTATION}")
 
-    # ── Quantisation config (load model in 8-bit for memory efficiency) ────────
+    # ── Quantisation config (QLoRA: 4-bit NF4 weights, double-quantised) ──────
     bnb_config = BitsAndBytesConfig(
-        load_in_8bit=True,
-        llm_int8_threshold=6.0,
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_use_double_quant=True,
+        bnb_4bit_compute_dtype=torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16,
     )
 
     # ── Load tokeniser ─────────────────────────────────────────────────────────
@@ -88,17 +111,25 @@ def train(model_name: str, dataset_path: str, output_dir: str):
     tokenizer.pad_token = tokenizer.eos_token
     tokenizer.padding_side = "right"
 
-    # ── Load base model with 8-bit quantisation ────────────────────────────────
+    # ── Load base model with 4-bit quantisation ────────────────────────────────
+    # Compute dtype comes from bnb_config
     model = AutoModelForCausalLM.from_pretrained(
         model_name,
         quantization_config=bnb_config,
         device_map="auto",
         trust_remote_code=True,
-        torch_dtype=torch.float16,
+        attn_implementation=ATTN_IMPLEMENTATION,
     )
     model.config.use_cache = False
     model.config.pretraining_tp = 1
 
+    # Cast norms/head for stable k-bit training and enable gradient checkpointing
+    model = prepare_model_for_kbit_training(
+        model,
+        use_gradient_checkpointing=True,
+        gradient_checkpointing_kwargs={"use_reentrant": False},
+    )
+
     # ── Wrap with LoRA adapters ────────────────────────────────────────────────
     model = get_peft_model(model, LORA_CONFIG)
     model.print_trainable_parameters()
@@ -127,7 +158,9 @@ def train(model_name: str, dataset_path: str, output_dir: str):
         args=training_args,
         dataset_text_field="text",
         max_seq_length=2048,
-        packing=False,
+        # Pack short ChatML samples into full 2048-token sequences — no pad tokens
+        packing=True,
+        dataset_num_proc=os.cpu_count(),
     )
 
     # ── MLflow run ─────────────────────────────────────────────────────────────
@@ -148,6 +181,8 @@ def train(model_name: str, dataset_path: str, output_dir: str):
             "epochs": TRAINING_DEFAULTS["num_train_epochs"],
             "batch_size": TRAINING_DEFAULTS["per_device_train_batch_size"],
             "gradient_accumulation": TRAINING_DEFAULTS["gradient_accumulation_steps"],
+            "attn_implementation": ATTN_IMPLEMENTATION,
+            "packing": True,
         })
 
         # Train
@@ -8,6 +8,9 @@
 #   - HallucinationMetric    (threshold 0.10) — answer does NOT add invented facts
 #   - ToxicityMetric         (threshold 0.05) — answer is safe and professional
 #
+# All metric × case judge calls are fanned out concurrently by deepeval's
+# async runner (bounded by MAX_CONCURRENT) instead of running one by one.
+#
 # Run locally:
 #   pip install -r requirements-dev.txt
 #   export OPENAI_API_KEY=sk-...   # DeepEval uses GPT-4o as judge by default
@@ -17,10 +20,10 @@
 
 import json
 import os
-import pytest
 from pathlib import Path
 
 from deepeval import evaluate
+from deepeval.evaluate import AsyncConfig, DisplayConfig
 from deepeval.metrics import (
     AnswerRelevancyMetric,
     FaithfulnessMetric,
@@ -36,6 +39,9 @@ DATASET_PATH = Path(__file__).parent / "golden_dataset.json"
 with open(DATASET_PATH) as f:
     GOLDEN: list[dict] = json.load(f)
 
+# Max in-flight judge calls (GPT-4o-mini rate limits permitting)
+MAX_CONCURRENT = int(os.environ.get("DEEPEVAL_MAX_CONCURRENT", "20"))
+
 # ─── Metrics ──────────────────────────────────────────────────────────────────
 
 metrics = [
@@ -59,17 +65,29 @@ test_cases = [
 
 # ─── pytest integration ───────────────────────────────────────────────────────
 
-@pytest.mark.parametrize("test_case", test_cases, ids=[g["input"][:50] for g in GOLDEN])
-def test_llm_quality(test_case: LLMTestCase):
+def test_llm_quality():
     """
-    Runs each golden test case through all 4 metrics.
-    Fails the build if any metric falls below its threshold.
+    Runs every golden test case through all 4 metrics in one concurrent batch.
+    Fails the build if any metric falls below its threshold on any case.
     """
-    for metric in metrics:
-        metric.measure(test_case)
-        assert metric.success, (
-            f"Metric '{metric.__class__.__name__}' FAILED for input: "
-            f"'{test_case.input[:60]}'\n"
-            f"Score: {metric.score:.3f} (threshold: {metric.threshold})\n"
-            f"Reason: {metric.reason}"
-        )
+    results = evaluate(
+        test_cases=test_cases,
+        metrics=metrics,
+        async_config=AsyncConfig(
+            run_async=True,
+            throttle_value=0,
+            max_concurrent=MAX_CONCURRENT,
+        ),
+        display_config=DisplayConfig(print_results=False),
+    )
+
+    failures = [
+        f"Metric '{metric.name}' FAILED for input: '{str(result.input)[:60]}'\n"
+        f"Score: {metric.score} (threshold: {metric.threshold})\n"
+        f"Reason: {metric.reason or metric.error}"
+        for result in results.test_results
+        for metric in result.metrics_data or []
+        if not metric.success
+    ]
+
+    assert not failures, "\n\n".join(failures)